@@ -1,12 +1,19 @@
 import os
-import json
+import sys
+import time
+import random
+import asyncio
+import functools
 import datetime
+import tempfile
+import threading
+from types import MappingProxyType
 from zoneinfo import ZoneInfo
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, NamedTuple, Optional, Set, Tuple
 
-import requests
+import httpx
+import orjson
 from dotenv import load_dotenv
-import markdown as md
 from telegram import (
     Update,
     InlineKeyboardButton,
@@ -16,11 +23,14 @@ from telegram import (
 )
 from telegram.error import BadRequest, NetworkError
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    PicklePersistence,
     filters,
 )
 
@@ -31,15 +41,52 @@ BOT_API_TOKEN = os.getenv("BOT_API_TOKEN", "")
 TG_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID", "")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID", "")
+# Backend /api/bot/post/ rasmni image_file_id orqali o'zi yuklay olsa — "1"
+BACKEND_FETCHES_IMAGES = os.getenv("BACKEND_FETCHES_IMAGES", "") == "1"
+# "1" bo'lsa, kanalga post backend javobidan oldin "⏳" bilan chiqadi va keyin tahrirlanadi
+CHANNEL_PLACEHOLDER = os.getenv("CHANNEL_PLACEHOLDER", "") == "1"
+# "1" bo'lsa, daily pick /api/bot/daily/mark_and_fetch/ orqali bitta so'rovda belgilanadi
+DAILY_MARK_AND_FETCH = os.getenv("DAILY_MARK_AND_FETCH", "") == "1"
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")
+WEBHOOK_PORT = int(os.getenv("PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("TG_WEBHOOK_SECRET") or None
 DAILY_TIME = os.getenv("DAILY_TIME", "09:00")
 DAILY_TZ = os.getenv("DAILY_TZ", "Asia/Tashkent")
 AI_POST_TIMES = os.getenv("AI_POST_TIMES", "09:00,15:00").split(",")
+# ZoneInfo bir marta yaratiladi — jadval va rejalashtirish shu obyektni ishlatadi
+TZ = ZoneInfo(DAILY_TZ)
+
+
+def parse_hhmm(value: str) -> datetime.time:
+    """'09:00' -> datetime.time; noto'g'ri qiymatda ValueError (job jimgina o'tkazib yuborilmaydi)"""
+    try:
+        hour, minute = value.strip().split(":")
+        return datetime.time(int(hour), int(minute))
+    except ValueError:
+        raise ValueError(f"Noto'g'ri vaqt sozlamasi (HH:MM kutilgan): {value!r}") from None
+
+
+# Vaqtlar import paytida bir marta parse qilinadi — xato sozlama botni darhol to'xtatadi
+DAILY_AT = parse_hhmm(DAILY_TIME)
+AI_POST_AT = [parse_hhmm(t) for t in AI_POST_TIMES if t.strip()]
+
 AI_POST_INSTRUCTIONS = os.getenv(
     "AI_POST_INSTRUCTIONS",
     "Python, dasturlash, veb dasturlash, Django, JavaScript haqida yozing. O'zbek tilida, qiziqarli va foydali maqolalar."
 )
 
-STEPS = ["title", "body", "desc", "image", "category", "tags", "schedule"]
+STEPS = ("title", "body", "desc", "image", "category", "tags", "schedule")
+# "Orqaga" uchun: har bir bosqichdan oldingisiga
+PREV_STEP = MappingProxyType({s: STEPS[max(i - 1, 0)] for i, s in enumerate(STEPS)})
+STEP_NAMES = MappingProxyType({
+    "title": "1/6 Sarlavha",
+    "body": "2/6 Matn",
+    "desc": "3/7 Description",
+    "image": "4/7 Rasm",
+    "category": "5/7 Kategoriya",
+    "tags": "6/7 Teglar",
+    "schedule": "7/7 Chiqish sana va vaqti",
+})
 
 
 def api_headers() -> Dict[str, str]:
@@ -48,31 +95,179 @@ def api_headers() -> Dict[str, str]:
     return {"Authorization": f"Bearer {BOT_API_TOKEN}"}
 
 
-def fetch_meta() -> Dict[str, Any]:
-    resp = requests.get(f"{API_BASE}/api/bot/meta/", headers=api_headers(), timeout=30)
-    resp.raise_for_status()
-    return resp.json()
+# Backend uchun umumiy async HTTP klient (post_init da yaratiladi)
+HTTP: Optional[httpx.AsyncClient] = None
+# Telegram fayl serveridan rasm oqimini o'qish uchun (ulanish qayta ishlatiladi)
+TG_FILES: Optional[httpx.AsyncClient] = None
+
+# Ulanish/pool tez yiqilsin, o'qish/yozish esa katta postlar uchun uzoqroq
+HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=60.0, pool=5.0)
 
 
-def fetch_recent_posts(limit: int = 10) -> Dict[str, Any]:
-    resp = requests.get(
-        f"{API_BASE}/api/bot/posts/",
+async def post_init(app):
+    global HTTP, TG_FILES
+    # httpx Expect: 100-continue yubormaydi; keep-alive esa pool orqali ishlaydi.
+    # HTTP/2 da fetch_meta va create_post bitta ulanishda parallel ketadi.
+    HTTP = httpx.AsyncClient(
+        base_url=API_BASE,
         headers=api_headers(),
-        params={"limit": limit},
-        timeout=30,
+        http2=True,
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
     )
+    TG_FILES = httpx.AsyncClient(http2=True, timeout=HTTP_TIMEOUT)
+    # Birinchi foydalanuvchi kategoriya tanlashini kutmasin — meta oldindan yuklanadi
+    try:
+        await fetch_meta()
+    except Exception as exc:
+        print(f"[BOT] Meta oldindan yuklanmadi: {exc}")
+
+
+async def post_shutdown(app):
+    for client in (HTTP, TG_FILES):
+        if client is not None:
+            await client.aclose()
+
+
+# Backend vaqtincha ishlamay qolganda qaytariladigan statuslar
+RETRY_STATUSES = {429, 502, 503, 504}
+# Bu statuslarda so'rov bajarilmagan — POST ham xavfsiz qayta yuboriladi
+REJECTED_STATUSES = {429, 502, 503}
+
+# Circuit breaker: ketma-ket shuncha muvaffaqiyatsiz so'rovdan keyin backend
+# CB_COOLDOWN soniya davomida chaqirilmaydi — foydalanuvchi darhol javob oladi
+CB_THRESHOLD = 5
+CB_COOLDOWN = 30.0
+_CB = {"fails": 0, "open_until": 0.0}
+
+
+def _cb_record(ok: bool):
+    if ok:
+        _CB["fails"] = 0
+        return
+    _CB["fails"] += 1
+    if _CB["fails"] >= CB_THRESHOLD:
+        _CB["open_until"] = time.monotonic() + CB_COOLDOWN
+
+
+async def request_with_retry(method: str, url: str, attempts: int = 3, **kwargs) -> httpx.Response:
+    """Vaqtinchalik xatolarda jitter bilan eksponensial kutib qayta urinish.
+
+    POST idempotent emas: faqat so'rov serverga yetib bormagan holatlar
+    (ulanish xatosi, 502/503) qayta uriniladi, aks holda post ikki marta
+    yaratilishi mumkin. Circuit breaker ochiq bo'lsa so'rov yuborilmaydi.
+    """
+    if _CB["open_until"] > time.monotonic():
+        raise RuntimeError("Backend vaqtincha ishlamayapti, birozdan keyin urinib ko'ring.")
+    idempotent = method.upper() == "GET"
+    retry_exc = httpx.TransportError if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+    retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+    timeout = kwargs.get("timeout")
+    if isinstance(timeout, (int, float)):
+        # timeout=180 faqat javobni kutishga tegishli; ulanish tez yiqilishi kerak
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=HTTP_TIMEOUT.connect, pool=HTTP_TIMEOUT.pool)
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            resp = await HTTP.request(method, url, **kwargs)
+        except httpx.TransportError as exc:
+            if last or not isinstance(exc, retry_exc):
+                _cb_record(False)
+                raise
+        else:
+            if last or resp.status_code not in retry_statuses:
+                _cb_record(resp.status_code < 500)
+                return resp
+        await asyncio.sleep(min(2.0, 0.1 * 2 ** attempt) * (0.5 + random.random()))
+
+
+def _error_preview(resp: httpx.Response, limit: int = 500) -> str:
+    """Xato javobining boshi — katta HTML sahifa to'liq dekod qilinmaydi"""
+    return resp.content[:limit].decode("utf-8", "replace") or "Empty response"
+
+
+def api_json(resp: httpx.Response) -> Dict[str, Any]:
+    """Backend javobini tekshirib JSON ni qaytarish; status, JSON yoki ok xato bo'lsa Exception"""
+    if not resp.is_success:
+        raise Exception(f"API error ({resp.status_code} {resp.reason_phrase}): {_error_preview(resp)}")
+    try:
+        data = orjson.loads(resp.content)
+    except orjson.JSONDecodeError as json_err:
+        raise Exception(f"JSON parsing error: {json_err}. Response: {_error_preview(resp)}")
+    if not data.get("ok"):
+        raise Exception(data.get("error") or "Unknown error")
+    return data
+
+
+# Bir xil admin xatosi shu oraliqda (soniya) takrorlansa, alohida xabarlar o'rniga
+# oraliq oxirida bitta "n× ..." xabari yuboriladi
+ADMIN_ERROR_WINDOW = 3.0
+_ADMIN_ERR_REPEATS: Dict[str, int] = {}
+_ADMIN_ERR_TASKS: Set[asyncio.Task] = set()
+
+
+async def _flush_admin_error(bot, text: str) -> None:
+    await asyncio.sleep(ADMIN_ERROR_WINDOW)
+    repeats = _ADMIN_ERR_REPEATS.pop(text, 0)
+    if repeats:
+        await bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"{repeats}× {text}")
+
+
+async def notify_admin_error(bot, text: str) -> None:
+    """Admin ga xato xabari; birinchisi darhol, takrorlari jamlanib yuboriladi"""
+    if not ADMIN_CHAT_ID:
+        return
+    if text in _ADMIN_ERR_REPEATS:
+        _ADMIN_ERR_REPEATS[text] += 1
+        return
+    _ADMIN_ERR_REPEATS[text] = 0
+    task = asyncio.create_task(_flush_admin_error(bot, text))
+    _ADMIN_ERR_TASKS.add(task)
+    task.add_done_callback(_ADMIN_ERR_TASKS.discard)
+    await bot.send_message(chat_id=ADMIN_CHAT_ID, text=text)
+
+
+# Kategoriya/teglar kam o'zgaradi — natija TTL davomida xotirada saqlanadi
+_META_CACHE: Optional[Tuple[float, Dict[str, Any]]] = None
+_META_TTL = 300.0
+_META_LOCK = asyncio.Lock()
+
+
+def invalidate_meta():
+    """Backend eskirgan kategoriya/tegni rad etganda keshni tozalash"""
+    global _META_CACHE
+    _META_CACHE = None
+
+
+async def fetch_meta() -> Dict[str, Any]:
+    global _META_CACHE
+    if _META_CACHE and time.monotonic() - _META_CACHE[0] < _META_TTL:
+        return _META_CACHE[1]
+    async with _META_LOCK:
+        # Lock kutilayotganda boshqa so'rov keshni to'ldirgan bo'lishi mumkin
+        if _META_CACHE and time.monotonic() - _META_CACHE[0] < _META_TTL:
+            return _META_CACHE[1]
+        resp = await request_with_retry("GET", "/api/bot/meta/", timeout=30)
+        resp.raise_for_status()
+        data = orjson.loads(resp.content)
+        # slug -> kategoriya: ID qidirishda ro'yxat bo'ylab yurilmaydi
+        data["categories_by_slug"] = {c["slug"]: c for c in data["categories"]}
+        _META_CACHE = (time.monotonic(), data)
+        build_category_keyboard(data["categories"])
+        _tag_buttons(data["tags"])
+        return data
+
+
+async def fetch_recent_posts(limit: int = 10) -> Dict[str, Any]:
+    resp = await request_with_retry("GET", "/api/bot/posts/", params={"limit": limit}, timeout=30)
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
 
 
-def fetch_daily_pick() -> Dict[str, Any]:
-    resp = requests.get(
-        f"{API_BASE}/api/bot/daily/next/",
-        headers=api_headers(),
-        timeout=30,
-    )
+async def fetch_daily_pick() -> Dict[str, Any]:
+    resp = await request_with_retry("GET", "/api/bot/daily/next/", timeout=30)
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
 
 
 # AI Topics ro'yxati
@@ -97,6 +292,9 @@ AI_TOPICS = [
 # AI Settings file
 AI_SETTINGS_FILE = "ai_settings.json"
 
+# Foydalanuvchi holati (user_data) restartdan keyin ham saqlanadigan fayl
+BOT_STATE_FILE = "bot_state.pkl"
+
 
 def load_ai_settings():
     """AI sozlamalarini yuklash"""
@@ -107,8 +305,8 @@ def load_ai_settings():
     }
     try:
         if os.path.exists(AI_SETTINGS_FILE):
-            with open(AI_SETTINGS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with open(AI_SETTINGS_FILE, "rb") as f:
+                data = orjson.loads(f.read())
                 # Default qiymatlar bilan birlashtirish
                 default_settings.update(data)
         return default_settings
@@ -116,11 +314,43 @@ def load_ai_settings():
         return default_settings
 
 
-def save_ai_settings(settings):
-    """AI sozlamalarini saqlash"""
+# Sozlamalar xotirada turadi: fayl faqat o'zgarganda (mtime) qayta o'qiladi
+_AI_SETTINGS: Optional[Dict[str, Any]] = None
+_AI_SETTINGS_MTIME: Optional[int] = None
+# Yozuvlar navbat bilan — eski yozuv yangisining ustidan tushmaydi
+_AI_SETTINGS_LOCK = asyncio.Lock()
+
+
+def _settings_mtime() -> Optional[int]:
+    try:
+        return os.stat(AI_SETTINGS_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _write_ai_settings(data: bytes) -> Optional[int]:
+    """Vaqtinchalik faylga yozib, os.replace bilan almashtiradi (yarim yozilgan fayl qolmaydi)"""
+    directory = os.path.dirname(os.path.abspath(AI_SETTINGS_FILE))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+        f.write(data)
     try:
-        with open(AI_SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        os.replace(f.name, AI_SETTINGS_FILE)
+    except OSError:
+        os.unlink(f.name)
+        raise
+    return _settings_mtime()
+
+
+async def save_ai_settings(settings) -> bool:
+    """AI sozlamalarini saqlash (disk yozuvi event loop dan tashqarida)"""
+    global _AI_SETTINGS, _AI_SETTINGS_MTIME
+    data = orjson.dumps(settings, option=orjson.OPT_INDENT_2)
+    try:
+        async with _AI_SETTINGS_LOCK:
+            mtime = await asyncio.to_thread(_write_ai_settings, data)
+            # Xotiradagi nusxa faqat fayl yozilgandan keyin yangilanadi — saqlash
+            # muvaffaqiyatsiz bo'lsa, eski sozlamalar kuchda qoladi
+            _AI_SETTINGS, _AI_SETTINGS_MTIME = orjson.loads(data), mtime
         return True
     except Exception:
         return False
@@ -128,42 +358,111 @@ def save_ai_settings(settings):
 
 def get_ai_settings():
     """Hozirgi sozlamalarni olish"""
-    return load_ai_settings()
+    global _AI_SETTINGS, _AI_SETTINGS_MTIME
+    # Fayl qo'lda tahrirlangan bo'lsa ham restartsiz kuchga kiradi
+    mtime = _settings_mtime()
+    if _AI_SETTINGS is None or mtime != _AI_SETTINGS_MTIME:
+        _AI_SETTINGS = load_ai_settings()
+        _AI_SETTINGS_MTIME = mtime
+    # Chaqiruvchilar natijani o'zgartirib, keyin saqlaydi — keshning o'zi emas, nusxasi
+    # qaytariladi (qiymatlar str yoki str ro'yxati, shuning uchun ro'yxat nusxasi yetarli)
+    return {k: list(v) if isinstance(v, list) else v for k, v in _AI_SETTINGS.items()}
+
+
+async def mark_daily_pick(pick_id: int, action: str) -> Dict[str, Any]:
+    resp = await request_with_retry(
+        "POST",
+        "/api/bot/daily/mark/",
+        data={"pick_id": pick_id, "action": action},
+        timeout=30,
+    )
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
 
 
-def mark_daily_pick(pick_id: int, action: str) -> Dict[str, Any]:
-    resp = requests.post(
-        f"{API_BASE}/api/bot/daily/mark/",
-        headers=api_headers(),
+async def mark_and_fetch_daily(pick_id: int, action: str) -> Dict[str, Any]:
+    """Belgilash va post ma'lumotini bitta so'rovda olish.
+
+    Backend javobi: {"ok": bool, "post": {...}, "next_pick_id": int | null}
+    """
+    resp = await request_with_retry(
+        "POST",
+        "/api/bot/daily/mark_and_fetch/",
         data={"pick_id": pick_id, "action": action},
         timeout=30,
     )
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
+
+
+# Klaviaturalar meta ro'yxati o'zgargandagina qayta yasaladi (fetch_meta keshi bilan birga)
+_CATEGORY_KB_CACHE: Dict[str, Any] = {"categories": None, "markup": None}
+_TAG_KB_CACHE: Dict[str, Any] = {"tags": None}
+_TAG_DONE_ROW = [InlineKeyboardButton("Tayyor", callback_data="tag:done")]
 
 
 def build_category_keyboard(categories: List[Dict[str, Any]]):
-    buttons = [
-        [InlineKeyboardButton(c["title"], callback_data=f"cat:{c['slug']}")]
-        for c in categories
-    ]
-    return InlineKeyboardMarkup(buttons)
+    if _CATEGORY_KB_CACHE["categories"] is not categories:
+        buttons = [
+            [InlineKeyboardButton(c["title"], callback_data=f"c{i}")]
+            for i, c in enumerate(categories)
+        ]
+        _CATEGORY_KB_CACHE.update(categories=categories, markup=InlineKeyboardMarkup(buttons))
+    return _CATEGORY_KB_CACHE["markup"]
 
 
-def build_tag_keyboard(tags: List[Dict[str, Any]], selected: List[str]):
-    buttons = []
-    for t in tags:
-        checked = "✅ " if t["slug"] in selected else ""
-        buttons.append(
-            [InlineKeyboardButton(f"{checked}{t['title']}", callback_data=f"tag:{t['slug']}")]
+def _tag_buttons(tags: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Teg tugmalari (belgilanmagan va belgilangan) va slug -> indeks jadvali"""
+    if _TAG_KB_CACHE["tags"] is not tags:
+        rows = [
+            [InlineKeyboardButton(t["title"], callback_data=f"t{i}")]
+            for i, t in enumerate(tags)
+        ]
+        _TAG_KB_CACHE.update(
+            tags=tags,
+            rows=rows,
+            index={t["slug"]: i for i, t in enumerate(tags)},
+            empty=InlineKeyboardMarkup(rows + [_TAG_DONE_ROW]),
+            checked={},
         )
-    buttons.append([InlineKeyboardButton("Tayyor", callback_data="tag:done")])
-    return InlineKeyboardMarkup(buttons)
+    return _TAG_KB_CACHE
+
+
+def build_tag_keyboard(tags: List[Dict[str, Any]], selected: Set[str]):
+    cache = _tag_buttons(tags)
+    if not selected:
+        return cache["empty"]
+    # Tanlangan teg tugmasi birinchi kerak bo'lganda yasaladi va keyin qayta ishlatiladi
+    rows = list(cache["rows"])
+    checked = cache["checked"]
+    for slug in selected:
+        idx = cache["index"].get(slug)
+        if idx is not None:
+            row = checked.get(idx)
+            if row is None:
+                row = checked[idx] = [InlineKeyboardButton(f"✅ {tags[idx]['title']}", callback_data=f"t{idx}")]
+            rows[idx] = row
+    rows.append(_TAG_DONE_ROW)
+    return InlineKeyboardMarkup(rows)
+
+
+@functools.lru_cache(maxsize=32)
+def ai_draft_keyboard(draft_id: int) -> InlineKeyboardMarkup:
+    """AI draft ko'rib chiqish tugmalari (draft_id bo'yicha bir marta yasaladi)"""
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"aidraft:approve:{draft_id}"),
+                InlineKeyboardButton("❌ Rad etish", callback_data=f"aidraft:reject:{draft_id}"),
+            ],
+            [InlineKeyboardButton("🔄 Qayta generatsiya", callback_data=f"aidraft:regenerate:{draft_id}")],
+        ]
+    )
 
 
-def build_schedule_keyboard():
-    """Chiqish sana/vaqtini tanlash uchun inline tugmalar."""
-    buttons = [
+# Chiqish sana/vaqtini tanlash uchun inline tugmalar (o'zgarmaydi)
+SCHEDULE_KB = InlineKeyboardMarkup(
+    [
         [InlineKeyboardButton("✅ Hozir", callback_data="schedule:now")],
         [
             InlineKeyboardButton("📅 Bugun 18:00", callback_data="schedule:today:18:00"),
@@ -175,344 +474,421 @@ def build_schedule_keyboard():
         ],
         [InlineKeyboardButton("📝 Boshqa sana", callback_data="schedule:custom")],
     ]
-    return InlineKeyboardMarkup(buttons)
+)
 
 
-def main_reply_keyboard():
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton("🆕 Yangi maqola"), KeyboardButton("✅ Matn tugadi")],
-            [KeyboardButton("📰 Oxirgi postlar"), KeyboardButton("📍 Holat")],
-            [KeyboardButton("⬅️ Orqaga"), KeyboardButton("⏭️ Skip rasm"), KeyboardButton("❌ Bekor")],
-        ],
-        resize_keyboard=True,
-    )
+# Pastki klaviatura yozuvlari — klaviatura ham, BUTTON_DISPATCH ham shu obyektlardan foydalanadi
+BTN_NEW = sys.intern("🆕 Yangi maqola")
+BTN_BODY_DONE = sys.intern("✅ Matn tugadi")
+BTN_RECENT = sys.intern("📰 Oxirgi postlar")
+BTN_STATUS = sys.intern("📍 Holat")
+BTN_BACK = sys.intern("⬅️ Orqaga")
+BTN_SKIP = sys.intern("⏭️ Skip rasm")
+BTN_CANCEL = sys.intern("❌ Bekor")
+
+# Pastki klaviatura o'zgarmaydi — bir marta yasaladi
+MAIN_KB = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton(BTN_NEW), KeyboardButton(BTN_BODY_DONE)],
+        [KeyboardButton(BTN_RECENT), KeyboardButton(BTN_STATUS)],
+        [KeyboardButton(BTN_BACK), KeyboardButton(BTN_SKIP), KeyboardButton(BTN_CANCEL)],
+    ],
+    resize_keyboard=True,
+)
+
+
+def main_kb(context: ContextTypes.DEFAULT_TYPE) -> Optional[ReplyKeyboardMarkup]:
+    """Pastki klaviatura Telegramda saqlanib qoladi — faqat user_data tozalangandan keyin qayta yuboriladi"""
+    if context.user_data.get("_kb_sent"):
+        return None
+    context.user_data["_kb_sent"] = True
+    return MAIN_KB
+
+
+def reset_main_kb(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Klaviatura olib ketgan xabar yuborilmagan bo'lishi mumkin — keyingi javobda qayta yuboriladi"""
+    if context.user_data is not None:
+        context.user_data.pop("_kb_sent", None)
 
 
 def step_name(step: str) -> str:
-    names = {
-        "title": "1/6 Sarlavha",
-        "body": "2/6 Matn",
-        "desc": "3/7 Description",
-        "image": "4/7 Rasm",
-        "category": "5/7 Kategoriya",
-        "tags": "6/7 Teglar",
-        "schedule": "7/7 Chiqish sana va vaqti",
-    }
-    return names.get(step, step)
+    return STEP_NAMES.get(step, step)
+
+
+# Admin chat ID bir marta int ga o'giriladi (username bo'lsa — None)
+ADMIN_ID = int(ADMIN_CHAT_ID) if ADMIN_CHAT_ID.lstrip("-").isdigit() else None
+
+
+def admin_only(handler):
+    """Buyruq faqat admin chatida ishlaydi, boshqalarga bitta umumiy javob"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat = update.effective_chat
+        if ADMIN_ID is None or chat is None or chat.id != ADMIN_ID:
+            await update.message.reply_text("❌ Bu funksiya faqat admin uchun.")
+            return
+        return await handler(update, context)
+    return wrapper
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
     context.user_data["step"] = "title"
-    await update.message.reply_text("📝 Yangi maqola. Sarlavhani yuboring.", reply_markup=main_reply_keyboard())
+    await update.message.reply_text("📝 Yangi maqola. Sarlavhani yuboring.", reply_markup=main_kb(context))
 
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     step = context.user_data.get("step", "title")
-    await update.message.reply_text(f"Joriy bosqich: {step_name(step)}", reply_markup=main_reply_keyboard())
+    await update.message.reply_text(f"Joriy bosqich: {step_name(step)}", reply_markup=main_kb(context))
+
+
+@admin_only
+async def reload_meta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Kategoriya/teglar keshini tozalab, backenddan qayta yuklash"""
+    invalidate_meta()
+    try:
+        meta = await fetch_meta()
+    except Exception as exc:
+        await update.message.reply_text(f"❌ Meta yuklanmadi: {exc}")
+        return
+    await update.message.reply_text(
+        f"✅ Meta yangilandi: {len(meta['categories'])} kategoriya, {len(meta['tags'])} teg."
+    )
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cancel_ai_draft_task(update.effective_user.id)
     context.user_data.clear()
-    await update.message.reply_text("Bekor qilindi. /new bilan qayta boshlang.", reply_markup=main_reply_keyboard())
+    await update.message.reply_text("Bekor qilindi. /new bilan qayta boshlang.", reply_markup=main_kb(context))
 
 
 async def back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     step = context.user_data.get("step", "title")
-    idx = max(STEPS.index(step) - 1, 0)
-    context.user_data["step"] = STEPS[idx]
+    context.user_data["step"] = PREV_STEP.get(step, "title")
     await update.message.reply_text(
         f"Orqaga qaytildi. Hozirgi bosqich: {step_name(context.user_data['step'])}",
-        reply_markup=main_reply_keyboard(),
+        reply_markup=main_kb(context),
     )
 
 
 async def skip_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     step = context.user_data.get("step")
     if step != "image":
-        await update.message.reply_text("Bu bosqichda skip ishlamaydi.", reply_markup=main_reply_keyboard())
+        await update.message.reply_text("Bu bosqichda skip ishlamaydi.", reply_markup=main_kb(context))
         return
-    context.user_data["photo_file_id"] = None
-    context.user_data["step"] = "category"
+    context.user_data.update(photo_file_id=None, step="category")
     try:
-        meta = fetch_meta()
+        meta = await fetch_meta()
     except Exception as exc:
-        await update.message.reply_text(f"❌ Kategoriya yuklanmadi: {exc}", reply_markup=main_reply_keyboard())
+        await update.message.reply_text(f"❌ Kategoriya yuklanmadi: {exc}", reply_markup=main_kb(context))
         return
+    context.user_data["all_categories"] = meta["categories"]
     await update.message.reply_text(
         "Rasm o‘tkazildi. Kategoriya tanlang:",
         reply_markup=build_category_keyboard(meta["categories"]),
     )
 
 
+async def skip_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # AI Draft uchun skip
+    if context.user_data.get("ai_draft_step") == "image":
+        context.user_data["ai_draft_photo_file_id"] = None
+        await finalize_ai_draft_post(update, context)
+        return
+    # Oddiy post uchun skip
+    await skip_image(update, context)
+
+
+async def body_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.user_data.get("body"):
+        await update.message.reply_text("Matn hali kiritilmagan.", reply_markup=main_kb(context))
+        return
+    context.user_data["step"] = "desc"
+    await update.message.reply_text("✅ Matn tugadi. Qisqa description yuboring.")
+
+
+async def handle_schedule_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    text_clean = text.strip()
+    if not text_clean or text_clean.lower() == "hozir":
+        context.user_data["scheduled_at"] = None
+        await update.message.reply_text("⏳ Post yuborilmoqda...")
+        await create_post(update, context)
+        return
+    # DD.MM.YYYY HH:MM yoki DD.MM.YYYY
+    scheduled_at = None
+    for fmt in ("%d.%m.%Y %H:%M", "%d.%m.%Y"):
+        try:
+            naive = datetime.datetime.strptime(text_clean, fmt)
+            if fmt == "%d.%m.%Y":
+                naive = naive.replace(hour=9, minute=0, second=0, microsecond=0)
+            scheduled_at = naive.replace(tzinfo=TZ)
+            if scheduled_at <= datetime.datetime.now(TZ):
+                await update.message.reply_text("❌ Sana va vaqt kelajakda bo'lishi kerak. Qayta kiriting yoki «Hozir» yozing.")
+                return
+            break
+        except ValueError:
+            continue
+    if scheduled_at is None:
+        await update.message.reply_text("❌ Noto'g'ri format. Masalan: 15.02.2026 14:30 yoki Hozir")
+        return
+    context.user_data["scheduled_at"] = scheduled_at
+    await update.message.reply_text("⏳ Post rejalashtirilmoqda...")
+    await create_post(update, context)
+
+
+async def handle_title_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    context.user_data.update(title=text, step="body")
+    await update.message.reply_text("✅ Sarlavha qabul qilindi. Endi matn yuboring.")
+
+
+async def handle_body_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    current = context.user_data.get("body", "")
+    if current:
+        current += "\n\n" + text
+    else:
+        current = text
+    context.user_data["body"] = current
+    await update.message.reply_text("✅ Qabul qilindi. Davom ettiring yoki 'Matn tugadi' bosing.")
+
+
+async def handle_desc_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    context.user_data.update(description=text, step="image")
+    await update.message.reply_text("✅ Description qabul qilindi. Endi rasm yuboring (yoki 'Skip rasm').")
+
+
+STEP_TEXT_HANDLERS = {
+    "schedule": handle_schedule_text,
+    "title": handle_title_text,
+    "body": handle_body_text,
+    "desc": handle_desc_text,
+}
+
+
+async def edit_instructions_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    settings = get_ai_settings()
+    settings['instructions'] = text
+    if await save_ai_settings(settings):
+        await update.message.reply_text("✅ Sozlama yangilandi!")
+    else:
+        await update.message.reply_text("❌ Xatolik: Sozlama saqlanmadi.")
+
+
+async def add_trend_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    settings = get_ai_settings()
+    settings.setdefault('trends', []).append(text)
+    if await save_ai_settings(settings):
+        await update.message.reply_text(f"✅ Trend qo'shildi: {text}")
+    else:
+        await update.message.reply_text("❌ Xatolik: Trend saqlanmadi.")
+
+
+async def add_topic_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    settings = get_ai_settings()
+    settings.setdefault('topics', []).append(text)
+    if await save_ai_settings(settings):
+        await update.message.reply_text(f"✅ Mavzu qo'shildi: {text}")
+    else:
+        await update.message.reply_text("❌ Xatolik: Mavzu saqlanmadi.")
+
+
+AI_SETTINGS_TEXT_HANDLERS = {
+    "edit_instructions": edit_instructions_text,
+    "add_trend": add_trend_text,
+    "add_topic": add_topic_text,
+}
+
+
+# Bir xil mavzu (katta-kichik harf, bo'shliq va tinish belgilaridan qat'i nazar) shu
+# sozlamalar bilan qayta yuborilsa, hali ko'rib chiqilmagan draft AI chaqiruvisiz qaytariladi
+AI_DRAFT_CACHE_TTL = 3600.0
+_AI_DRAFT_CACHE: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+
+
+def _topic_key(topic: str) -> str:
+    cleaned = "".join(ch if ch.isalnum() else " " for ch in topic.casefold())
+    return " ".join(cleaned.split())
+
+
+def cached_ai_draft(key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+    now = time.monotonic()
+    for stale in [k for k, (ts, _) in _AI_DRAFT_CACHE.items() if now - ts >= AI_DRAFT_CACHE_TTL]:
+        del _AI_DRAFT_CACHE[stale]
+    entry = _AI_DRAFT_CACHE.get(key)
+    return entry[1] if entry else None
+
+
+def forget_ai_draft(draft_id: int) -> None:
+    """Tasdiqlangan/rad etilgan/qayta yozilgan draftni keshdan olib tashlash"""
+    for key in [k for k, (_, d) in _AI_DRAFT_CACHE.items() if str(d.get("draft_id")) == str(draft_id)]:
+        del _AI_DRAFT_CACHE[key]
+
+
+async def run_ai_draft(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Mavzu bo'yicha AI draft yaratib, admin ga ko'rib chiqish tugmalari bilan yuborish"""
+    try:
+        settings = get_ai_settings()
+        instructions = settings.get('instructions', AI_POST_INSTRUCTIONS)
+        trends = settings.get('trends', [])
+        if trends:
+            trends_text = "\n\nHozirgi trendlar:\n" + "\n".join(f"- {t}" for t in trends)
+            instructions = instructions + trends_text
+
+        cache_key = (_topic_key(text), instructions)
+        data = cached_ai_draft(cache_key)
+        if data is None:
+            resp = await request_with_retry(
+                "POST",
+                "/api/bot/ai/draft/create/",
+                data={
+                    "topic": text,
+                    "instructions": instructions,
+                },
+                timeout=180,
+            )
+            data = api_json(resp)
+
+        draft_id = data.get("draft_id")
+        title = data.get("title")
+        description = data.get("description")
+        body_preview = data.get("body_markdown", "")[:300]
+
+        if not draft_id or not title:
+            raise Exception("API response missing required fields")
+        _AI_DRAFT_CACHE[cache_key] = (time.monotonic(), data)
+
+        msg = (
+            f"🤖 *AI yangi draft yaratdi:*\n\n"
+            f"📌 *Mavzu:* {text}\n\n"
+            f"📝 *Sarlavha:* {title}\n\n"
+            f"📄 *Description:*\n{description}\n\n"
+            f"📖 *Body (preview):*\n{body_preview}...\n\n"
+            f"`Draft ID: {draft_id}`"
+        )
+
+        await update.message.reply_text(
+            msg,
+            parse_mode="Markdown",
+            reply_markup=ai_draft_keyboard(draft_id),
+        )
+    except httpx.HTTPError as exc:
+        error_msg = str(exc)
+        if len(error_msg) > 1000:
+            error_msg = error_msg[:1000] + "..."
+        await update.message.reply_text(f"❌ Tarmoq xatosi: {error_msg}")
+        await notify_admin_error(context.bot, f"❌ AI draft network error: {exc}")
+    except Exception as exc:
+        error_msg = str(exc)
+        if len(error_msg) > 1000:
+            error_msg = error_msg[:1000] + "..."
+        await update.message.reply_text(f"❌ AI draft xato: {error_msg}")
+        await notify_admin_error(context.bot, f"❌ AI draft error: {exc}")
+
+
+# Foydalanuvchi -> ishlayotgan AI draft vazifasi. user_data pickle qilinadi, shuning
+# uchun Task u yerda emas, shu yerda saqlanadi (/cancel uni to'xtatadi)
+_AI_DRAFT_TASKS: Dict[int, asyncio.Task] = {}
+
+
+def start_ai_draft_task(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+    user_id = update.effective_user.id
+    task = context.application.create_task(run_ai_draft(update, context, text), update=update)
+    _AI_DRAFT_TASKS[user_id] = task
+
+    def _done(finished: asyncio.Task) -> None:
+        if _AI_DRAFT_TASKS.get(user_id) is finished:
+            del _AI_DRAFT_TASKS[user_id]
+
+    task.add_done_callback(_done)
+
+
+def cancel_ai_draft_task(user_id: int) -> None:
+    task = _AI_DRAFT_TASKS.pop(user_id, None)
+    if task is not None:
+        task.cancel()
+
+
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
 
+    # Bir martalik rejim kalitlari o'qilganda o'chiriladi — user_data (va pickle) da
+    # None qiymatli eski kalitlar to'planib qolmaydi
     # AI mavzu kiritish rejimi
-    if context.user_data.get("ai_mode") == "await_topic":
-        context.user_data["ai_mode"] = None
+    if context.user_data.pop("ai_mode", None) == "await_topic":
         await update.message.reply_text("⏳ AI draft generatsiya qilmoqda...")
         try:
-            resp = requests.post(
-                f"{API_BASE}/api/bot/ai/post-idea/",
-                headers=api_headers(),
+            resp = await request_with_retry(
+                "POST",
+                "/api/bot/ai/post-idea/",
                 data={"topic": text},
                 timeout=120,
             )
-            data = resp.json()
-            if not resp.ok or not data.get("ok"):
-                raise Exception(data.get("error") or resp.text)
+            data = api_json(resp)
             idea = data["data"]
             
-            # Uzun javoblarni bo'laklarga bo'lish
             header_msg = (
                 f"🧠 AI g'oya:\n\n"
                 f"📌 *Sarlavha:* {idea['title']}\n\n"
                 f"📝 *Description:*\n{idea['description']}\n\n"
             )
-            await update.message.reply_text(header_msg, parse_mode="Markdown")
-            
-            # Body alohida xabarda (agar uzun bo'lsa, bo'laklarga bo'lish)
             body = idea['body_markdown']
             footer_text = "\n\nAgar yoqsa, /new bosib, AI bergan sarlavha/description/body'ni copy-paste qilib yuklashingiz mumkin."
-            
-            if len(body) > 3500:
-                # Body juda uzun bo'lsa, bo'laklarga bo'lish
-                chunks = [body[i:i+3500] for i in range(0, len(body), 3500)]
-                for idx, chunk in enumerate(chunks):
-                    prefix = f"📄 *Draft (qism {idx+1}/{len(chunks)}):*\n\n" if len(chunks) > 1 else "📄 *Draft:*\n\n"
-                    suffix = footer_text if idx == len(chunks) - 1 else ""
-                    await update.message.reply_text(f"{prefix}{chunk}{suffix}", parse_mode="Markdown")
+
+            # Sarlavha, body va footer imkon qadar bitta xabarga sig'diriladi;
+            # body uzun bo'lsagina bo'laklarga bo'linadi (sarlavha birinchisida, footer oxirgisida)
+            if _utf16_len(header_msg) + _utf16_len(body) + _utf16_len(footer_text) + 16 <= MESSAGE_LIMIT:
+                messages = [f"{header_msg}📄 *Draft:*\n\n{body}{footer_text}"]
             else:
-                await update.message.reply_text(f"📄 *Draft:*\n\n{body}{footer_text}", parse_mode="Markdown")
+                room = MESSAGE_LIMIT - _utf16_len(header_msg) - _utf16_len(footer_text) - 32
+                # Sarlavha/description juda uzun bo'lsa, ular alohida xabar(lar)da ketadi
+                # va body to'liq chegara bo'yicha bo'linadi
+                separate = room < MIN_BODY_ROOM
+                chunks = list(_chunk_u16(body, MESSAGE_LIMIT - 32 if separate else room))
+                messages = [
+                    f"📄 *Draft (qism {idx + 1}/{len(chunks)}):*\n\n{chunk}"
+                    for idx, chunk in enumerate(chunks)
+                ]
+                if separate:
+                    messages = list(_chunk_u16(header_msg, MESSAGE_LIMIT)) + messages + [footer_text.strip()]
+                else:
+                    messages[0] = header_msg + messages[0]
+                    messages[-1] += footer_text
+            for message in messages:
+                await update.message.reply_text(message, parse_mode="Markdown")
                 
         except Exception as exc:
-            if ADMIN_CHAT_ID:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ AI xato: {exc}")
+            await notify_admin_error(context.bot, f"❌ AI xato: {exc}")
             await update.message.reply_text("❌ AI draft yaratishda xatolik yuz berdi. Keyinroq urinib ko'ring.")
         return
 
     # Manual AI Draft mavzu kiritish rejimi
-    if context.user_data.get("ai_draft_mode") == "await_topic":
-        context.user_data["ai_draft_mode"] = None
-        context.user_data["ai_draft_manual"] = None
+    if context.user_data.pop("ai_draft_mode", None) == "await_topic":
+        context.user_data.pop("ai_draft_manual", None)
         await update.message.reply_text("⏳ AI draft generatsiya qilmoqda... Bu biroz vaqt olishi mumkin.")
         
-        try:
-            settings = get_ai_settings()
-            instructions = settings.get('instructions', AI_POST_INSTRUCTIONS)
-            trends = settings.get('trends', [])
-            if trends:
-                trends_text = "\n\nHozirgi trendlar:\n" + "\n".join(f"- {t}" for t in trends)
-                instructions = instructions + trends_text
-            
-            resp = requests.post(
-                f"{API_BASE}/api/bot/ai/draft/create/",
-                headers=api_headers(),
-                data={
-                    "topic": text,
-                    "instructions": instructions,
-                },
-                timeout=180,
-            )
-            
-            # Response status code tekshirish
-            if not resp.ok:
-                error_text = resp.text[:500] if resp.text else "Unknown error"
-                raise Exception(f"API error ({resp.status_code}): {error_text}")
-            
-            # JSON parsing xatolarini handle qilish
-            try:
-                data = resp.json()
-            except ValueError as json_err:
-                error_text = resp.text[:500] if resp.text else "Empty response"
-                raise Exception(f"JSON parsing error: {json_err}. Response: {error_text}")
-            
-            if not data.get("ok"):
-                error_msg = data.get("error", "Unknown error")
-                raise Exception(error_msg)
-            
-            draft_id = data.get("draft_id")
-            title = data.get("title")
-            description = data.get("description")
-            body_preview = data.get("body_markdown", "")[:300]
-            
-            if not draft_id or not title:
-                raise Exception("API response missing required fields")
-            
-            msg = (
-                f"🤖 *AI yangi draft yaratdi:*\n\n"
-                f"📌 *Mavzu:* {text}\n\n"
-                f"📝 *Sarlavha:* {title}\n\n"
-                f"📄 *Description:*\n{description}\n\n"
-                f"📖 *Body (preview):*\n{body_preview}...\n\n"
-                f"`Draft ID: {draft_id}`"
-            )
-            
-            buttons = [
-                [
-                    InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"aidraft:approve:{draft_id}"),
-                    InlineKeyboardButton("❌ Rad etish", callback_data=f"aidraft:reject:{draft_id}"),
-                ],
-                [
-                    InlineKeyboardButton("🔄 Qayta generatsiya", callback_data=f"aidraft:regenerate:{draft_id}"),
-                ],
-            ]
-            
-            await update.message.reply_text(
-                msg,
-                parse_mode="Markdown",
-                reply_markup=InlineKeyboardMarkup(buttons),
-            )
-        except requests.exceptions.RequestException as exc:
-            error_msg = str(exc)
-            if len(error_msg) > 1000:
-                error_msg = error_msg[:1000] + "..."
-            await update.message.reply_text(f"❌ Tarmoq xatosi: {error_msg}")
-            if ADMIN_CHAT_ID:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ AI draft network error: {exc}")
-        except Exception as exc:
-            error_msg = str(exc)
-            if len(error_msg) > 1000:
-                error_msg = error_msg[:1000] + "..."
-            await update.message.reply_text(f"❌ AI draft xato: {error_msg}")
-            if ADMIN_CHAT_ID:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ AI draft error: {exc}")
+        # Chaqiruv 180 s gacha davom etadi — handler darhol qaytadi va shu chatdagi
+        # boshqa tugmalar (Holat, Bekor qilish) kutib qolmaydi
+        start_ai_draft_task(update, context, text)
         return
 
     # AI Settings mode
-    if context.user_data.get("ai_settings_mode") == "edit_instructions":
-        context.user_data["ai_settings_mode"] = None
-        settings = get_ai_settings()
-        settings['instructions'] = text
-        if save_ai_settings(settings):
-            await update.message.reply_text("✅ Sozlama yangilandi!")
-        else:
-            await update.message.reply_text("❌ Xatolik: Sozlama saqlanmadi.")
-        return
-    
-    if context.user_data.get("ai_settings_mode") == "add_trend":
-        context.user_data["ai_settings_mode"] = None
-        settings = get_ai_settings()
-        if 'trends' not in settings:
-            settings['trends'] = []
-        settings['trends'].append(text)
-        if save_ai_settings(settings):
-            await update.message.reply_text(f"✅ Trend qo'shildi: {text}")
-        else:
-            await update.message.reply_text("❌ Xatolik: Trend saqlanmadi.")
-        return
-    
-    if context.user_data.get("ai_settings_mode") == "add_topic":
-        context.user_data["ai_settings_mode"] = None
-        settings = get_ai_settings()
-        if 'topics' not in settings:
-            settings['topics'] = []
-        settings['topics'].append(text)
-        if save_ai_settings(settings):
-            await update.message.reply_text(f"✅ Mavzu qo'shildi: {text}")
-        else:
-            await update.message.reply_text("❌ Xatolik: Mavzu saqlanmadi.")
-        return
-    
-    # AI Trend mode (ai_trends_command dan)
-    if context.user_data.get("ai_trend_mode") == "add":
-        context.user_data["ai_trend_mode"] = None
-        settings = get_ai_settings()
-        if 'trends' not in settings:
-            settings['trends'] = []
-        settings['trends'].append(text)
-        if save_ai_settings(settings):
-            await update.message.reply_text(f"✅ Trend qo'shildi: {text}")
-        else:
-            await update.message.reply_text("❌ Xatolik: Trend saqlanmadi.")
-        return
-
-    if text == "🆕 Yangi maqola":
-        await start(update, context)
-        return
-    if text == "📰 Oxirgi postlar":
-        await show_recent_posts(update, context)
-        return
-    if text == "📍 Holat":
-        await status(update, context)
-        return
-    if text == "⬅️ Orqaga":
-        await back(update, context)
-        return
-    if text == "⏭️ Skip rasm":
-        # AI Draft uchun skip
-        if context.user_data.get("ai_draft_step") == "image":
-            context.user_data["ai_draft_photo_file_id"] = None
-            await finalize_ai_draft_post(update, context)
-            return
-        # Oddiy post uchun skip
-        await skip_image(update, context)
-        return
-    if text == "❌ Bekor":
-        await cancel(update, context)
-        return
-    if text == "✅ Matn tugadi":
-        if not context.user_data.get("body"):
-            await update.message.reply_text("Matn hali kiritilmagan.", reply_markup=main_reply_keyboard())
-            return
-        context.user_data["step"] = "desc"
-        await update.message.reply_text("✅ Matn tugadi. Qisqa description yuboring.")
-        return
-
-    step = context.user_data.get("step", "title")
-
-    if step == "schedule":
-        text_clean = text.strip()
-        if not text_clean or text_clean.lower() == "hozir":
-            context.user_data["scheduled_at"] = None
-            await update.message.reply_text("⏳ Post yuborilmoqda...")
-            await create_post(update, context)
-            return
-        # DD.MM.YYYY HH:MM yoki DD.MM.YYYY
-        scheduled_at = None
-        for fmt in ("%d.%m.%Y %H:%M", "%d.%m.%Y"):
-            try:
-                naive = datetime.datetime.strptime(text_clean, fmt)
-                if fmt == "%d.%m.%Y":
-                    naive = naive.replace(hour=9, minute=0, second=0, microsecond=0)
-                scheduled_at = naive.replace(tzinfo=ZoneInfo(DAILY_TZ))
-                if scheduled_at <= datetime.datetime.now(ZoneInfo(DAILY_TZ)):
-                    await update.message.reply_text("❌ Sana va vaqt kelajakda bo'lishi kerak. Qayta kiriting yoki «Hozir» yozing.")
-                    return
-                break
-            except ValueError:
-                continue
-        if scheduled_at is None:
-            await update.message.reply_text("❌ Noto'g'ri format. Masalan: 15.02.2026 14:30 yoki Hozir")
-            return
-        context.user_data["scheduled_at"] = scheduled_at
-        await update.message.reply_text("⏳ Post rejalashtirilmoqda...")
-        await create_post(update, context)
+    settings_handler = AI_SETTINGS_TEXT_HANDLERS.get(context.user_data.pop("ai_settings_mode", None))
+    if settings_handler is not None:
+        await settings_handler(update, context, text)
         return
 
-    if step == "title":
-        context.user_data["title"] = text
-        context.user_data["step"] = "body"
-        await update.message.reply_text("✅ Sarlavha qabul qilindi. Endi matn yuboring.")
+    # AI Trend mode (ai_trends_command dan)
+    if context.user_data.pop("ai_trend_mode", None) == "add":
+        await add_trend_text(update, context, text)
         return
 
-    if step == "body":
-        current = context.user_data.get("body", "")
-        if current:
-            current += "\n\n" + text
-        else:
-            current = text
-        context.user_data["body"] = current
-        await update.message.reply_text("✅ Qabul qilindi. Davom ettiring yoki 'Matn tugadi' bosing.")
+    handler = BUTTON_DISPATCH.get(text)
+    if handler is not None:
+        await handler(update, context)
         return
 
-    if step == "desc":
-        context.user_data["description"] = text
-        context.user_data["step"] = "image"
-        await update.message.reply_text("✅ Description qabul qilindi. Endi rasm yuboring (yoki 'Skip rasm').")
-        return
+    step_handler = STEP_TEXT_HANDLERS.get(context.user_data.get("step", "title"))
+    if step_handler is not None:
+        await step_handler(update, context, text)
 
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -530,13 +906,13 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if step != "image":
         await update.message.reply_text("Rasm bosqichida emassiz. 'Holat' ni bosing.")
         return
-    context.user_data["photo_file_id"] = update.message.photo[-1].file_id
-    context.user_data["step"] = "category"
+    context.user_data.update(photo_file_id=update.message.photo[-1].file_id, step="category")
     try:
-        meta = fetch_meta()
+        meta = await fetch_meta()
     except Exception as exc:
         await update.message.reply_text(f"❌ Kategoriya yuklanmadi: {exc}")
         return
+    context.user_data["all_categories"] = meta["categories"]
     await update.message.reply_text(
         "✅ Rasm qabul qilindi. Kategoriya tanlang:",
         reply_markup=build_category_keyboard(meta["categories"]),
@@ -545,14 +921,13 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def _parse_schedule_datetime(day_offset: int, time_str: str) -> Optional[datetime.datetime]:
     """day_offset: 0=bugun, 1=ertaga, 3=3 kun keyin. time_str: '09:00' yoki '18:00'."""
-    tz = ZoneInfo(DAILY_TZ)
-    now = datetime.datetime.now(tz)
+    now = datetime.datetime.now(TZ)
     target_date = (now.date() + datetime.timedelta(days=day_offset))
     try:
         h, m = time_str.split(":")
         target = datetime.datetime(
             target_date.year, target_date.month, target_date.day,
-            int(h), int(m), 0, 0, tzinfo=tz,
+            int(h), int(m), 0, 0, tzinfo=TZ,
         )
         return target
     except (ValueError, TypeError):
@@ -561,6 +936,9 @@ def _parse_schedule_datetime(day_offset: int, time_str: str) -> Optional[datetim
 
 async def handle_schedule_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
     query = update.callback_query
+    if context.user_data.get("step") != "schedule":
+        # Post allaqachon yuborilgan yoki oqim bekor qilingan — eski tugma
+        return
     parts = data.split(":")
     if len(parts) < 2:
         return
@@ -593,14 +971,13 @@ async def handle_schedule_callback(update: Update, context: ContextTypes.DEFAULT
             pass
 
     if scheduled_at is None:
-        await query.edit_message_text("❌ Noto'g'ri tanlov. Qayta tanlang yoki «Boshqa sana».", reply_markup=build_schedule_keyboard())
+        await query.edit_message_text("❌ Noto'g'ri tanlov. Qayta tanlang yoki «Boshqa sana».", reply_markup=SCHEDULE_KB)
         return
 
-    tz = ZoneInfo(DAILY_TZ)
-    if scheduled_at <= datetime.datetime.now(tz):
+    if scheduled_at <= datetime.datetime.now(TZ):
         await query.edit_message_text(
             "❌ Bu vaqt o'tgan. Boshqa variant tanlang yoki «Boshqa sana» orqali kelajakdagi sana kiriting.",
-            reply_markup=build_schedule_keyboard(),
+            reply_markup=SCHEDULE_KB,
         )
         return
 
@@ -609,15 +986,76 @@ async def handle_schedule_callback(update: Update, context: ContextTypes.DEFAULT
     await create_post(update, context)
 
 
+class FlowSpec(NamedTuple):
+    """Kategoriya/teg bosqichlarida AI draft va oddiy post oqimlari farqi"""
+
+    step_key: str
+    category_key: str
+    category_id_key: str
+    after_tags_step: str
+    after_tags_text: str
+    after_tags_markup: Optional[InlineKeyboardMarkup]
+
+
+# AI draft: teglardan keyin rasm so'raladi
+AI_FLOW = FlowSpec(
+    "ai_draft_step",
+    "ai_draft_category_slug",
+    "ai_draft_category_id",
+    "image",
+    "Endi rasm yuboring (yoki 'Skip rasm' tugmasini bosing):",
+    None,
+)
+# Oddiy post: teglardan keyin chiqish sana/vaqti inline tugmalar bilan so'raladi
+POST_FLOW = FlowSpec(
+    "step",
+    "category_slug",
+    "category_id",
+    "schedule",
+    "📅 Chiqish sana va vaqtini tanlang:",
+    SCHEDULE_KB,
+)
+
+
+def current_flow(context: ContextTypes.DEFAULT_TYPE, step: str) -> FlowSpec:
+    return AI_FLOW if context.user_data.get("ai_draft_step") == step else POST_FLOW
+
+
+# Shu oraliqda bir xil tugma qayta bosilsa (double-tap) e'tiborsiz qoldiriladi, soniya.
+# Faqat post yuboradigan/holatni yakunlaydigan tugmalar uchun — teg (t<i>) kabi
+# almashtirgichlarni tez ikki marta bosish (tanlash/bekor qilish) normal holat
+CALLBACK_DEBOUNCE = 0.5
+DEBOUNCED_CALLBACKS = ("schedule:", "tag:done", "postid:", "daily:", "aidraft:")
+
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     data = query.data or ""
+    if not data.startswith(DEBOUNCED_CALLBACKS):
+        await dispatch_callback(update, context, data)
+        return
+    # Bitta chat update'lari navbat bilan ishlanadi, shuning uchun takroriy bosish
+    # birinchisi tugagach keladi — vaqt boshlanishda ham, oxirida ham yoziladi
+    last = context.user_data.get("_last_cb")
+    if last and last[0] == data and time.time() - last[1] < CALLBACK_DEBOUNCE:
+        return
+    context.user_data["_last_cb"] = (data, time.time())
+    try:
+        await dispatch_callback(update, context, data)
+    finally:
+        context.user_data["_last_cb"] = (data, time.time())
+
+
+async def dispatch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
 
     if data.startswith("postid:"):
         post_id = data.split(":", 1)[1]
-        post_lookup = context.user_data.get("recent_posts", {})
-        post = post_lookup.get(post_id)
+        post = context.user_data.get("recent_posts", {}).get(post_id)
+        if not post and _RECENT_CACHE:
+            # Boshqa foydalanuvchi ko'rgan ro'yxatdan (masalan, forward qilingan xabar)
+            post = _RECENT_CACHE[1].get(post_id)
         if not post:
             await query.edit_message_text("Post topilmadi. Qayta urinib ko'ring.")
             return
@@ -652,82 +1090,227 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_ai_trends_callback(update, context, action)
         return
 
-    # Category tanlash - AI Draft yoki oddiy post uchun
-    if data.startswith("cat:"):
-        if context.user_data.get("ai_draft_step") == "category":
-            # AI Draft uchun
-            category_slug = data.split(":", 1)[1]
-            context.user_data["ai_draft_category_slug"] = category_slug
-            context.user_data["ai_draft_step"] = "tags"
-            try:
-                meta = fetch_meta()
-            except Exception as exc:
-                await query.edit_message_text(f"❌ Teglar yuklanmadi: {exc}")
-                return
-            context.user_data["all_tags"] = meta["tags"]
-            context.user_data["selected_tags"] = []
-            await query.edit_message_text(
-                "Teglarni tanlang:",
-                reply_markup=build_tag_keyboard(meta["tags"], []),
-            )
-        else:
-            # Oddiy post uchun
-            context.user_data["category_slug"] = data.split(":", 1)[1]
-            context.user_data["step"] = "tags"
-            try:
-                meta = fetch_meta()
-            except Exception as exc:
-                await query.edit_message_text(f"❌ Teglar yuklanmadi: {exc}")
-                return
-            context.user_data["all_tags"] = meta["tags"]
-            context.user_data["selected_tags"] = []
-            await query.edit_message_text(
-                "Teglarni tanlang:",
-                reply_markup=build_tag_keyboard(meta["tags"], []),
-            )
+    # Category tanlash - AI Draft yoki oddiy post uchun.
+    # callback_data "c<indeks>": slug klaviatura ko'rsatilganda saqlangan ro'yxatdan olinadi
+    if data[:1] == "c" and data[1:].isdigit():
+        categories = context.user_data.get("all_categories") or []
+        idx = int(data[1:])
+        if idx >= len(categories):
+            await query.edit_message_text("Kategoriya ro'yxati eskirgan. Qaytadan boshlang.")
+            return
+        category = categories[idx]
+        flow = current_flow(context, "category")
+        # id ham saqlanadi — finalize_ai_draft_post meta ni qayta so'ramaydi
+        context.user_data.update({
+            flow.category_key: category["slug"],
+            flow.category_id_key: category.get("id"),
+            flow.step_key: "tags",
+        })
+        try:
+            meta = await fetch_meta()
+        except Exception as exc:
+            await query.edit_message_text(f"❌ Teglar yuklanmadi: {exc}")
+            return
+        context.user_data.update(all_tags=meta["tags"], selected_tags=set())
+        await query.edit_message_text(
+            "Teglarni tanlang:",
+            reply_markup=build_tag_keyboard(meta["tags"], set()),
+        )
+        return
+
+    # Tag tanlash - AI Draft yoki oddiy post uchun ("t<indeks>" yoki "tag:done")
+    if data == "tag:done":
+        flow = current_flow(context, "tags")
+        context.user_data[flow.step_key] = flow.after_tags_step
+        await query.edit_message_text(flow.after_tags_text, reply_markup=flow.after_tags_markup)
         return
 
-    # Tag tanlash - AI Draft yoki oddiy post uchun
-    if data.startswith("tag:"):
-        value = data.split(":", 1)[1]
-        selected = context.user_data.get("selected_tags", [])
+    if data[:1] == "t" and data[1:].isdigit():
+        selected = context.user_data.setdefault("selected_tags", set())
         all_tags = context.user_data.get("all_tags", [])
-        
-        if value == "done":
-            if context.user_data.get("ai_draft_step") == "tags":
-                # AI Draft uchun - rasm so'rash
-                context.user_data["ai_draft_step"] = "image"
-                await query.edit_message_text("Endi rasm yuboring (yoki 'Skip rasm' tugmasini bosing):")
-            else:
-                # Oddiy post uchun — chiqish sana/vaqtini inline tugmalar bilan so'ra
-                context.user_data["step"] = "schedule"
-                await query.edit_message_text(
-                    "📅 Chiqish sana va vaqtini tanlang:",
-                    reply_markup=build_schedule_keyboard(),
-                )
+        idx = int(data[1:])
+        if idx >= len(all_tags):
+            await query.edit_message_text("Teglar ro'yxati eskirgan. Qaytadan boshlang.")
             return
-
-        if value in selected:
-            selected.remove(value)
-        else:
-            selected.append(value)
-        context.user_data["selected_tags"] = selected
+        selected ^= {all_tags[idx]["slug"]}
         await query.edit_message_text(
             "Teglarni tanlang:",
             reply_markup=build_tag_keyboard(all_tags, selected),
         )
 
 
+# get_file natijasi (yuklab olish havolasi kamida 1 soat amal qiladi) — qayta urinishda
+# Telegramdan qayta so'ralmaydi. Rasm baytlari saqlanmaydi: ular oqim bilan uzatiladi.
+_TG_FILE_CACHE: Dict[str, Tuple[float, Any]] = {}
+_TG_FILE_TTL = 50 * 60
+_TG_FILE_MAX = 32
+
+
+async def get_tg_file(context: ContextTypes.DEFAULT_TYPE, file_id: str):
+    cached = _TG_FILE_CACHE.get(file_id)
+    if cached and time.monotonic() - cached[0] < _TG_FILE_TTL:
+        return cached[1]
+    file = await context.bot.get_file(file_id)
+    if len(_TG_FILE_CACHE) >= _TG_FILE_MAX:
+        # Eng eski yozuv chiqariladi (dict qo'shilish tartibini saqlaydi)
+        del _TG_FILE_CACHE[next(iter(_TG_FILE_CACHE))]
+    _TG_FILE_CACHE[file_id] = (time.monotonic(), file)
+    return file
+
+
+async def post_with_streamed_image(path: str, fields: Dict[str, str], file) -> httpx.Response:
+    """Telegram rasmini xotiraga yuklamasdan backendga multipart qilib uzatish"""
+    boundary = os.urandom(16).hex()
+    head = "".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'
+        for k, v in fields.items()
+    )
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="post.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    )
+    head_bytes = head.encode("utf-8")
+    tail_bytes = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+    async with TG_FILES.stream("GET", file.file_path) as src:
+        src.raise_for_status()
+
+        async def body():
+            yield head_bytes
+            async for chunk in src.aiter_bytes():
+                yield chunk
+            yield tail_bytes
+
+        size = file.file_size or src.headers.get("content-length")
+        if not size:
+            # Hajm noma'lum: Django chunked so'rovni o'qimaydi, shuning uchun rasm
+            # vaqtinchalik faylga yig'iladi (kichik bo'lsa xotirada qoladi)
+            with tempfile.SpooledTemporaryFile(max_size=2_000_000) as buf:
+                async for chunk in src.aiter_bytes():
+                    buf.write(chunk)
+                buf.seek(0)
+                return await HTTP.post(path, data=fields, files={"image": ("post.jpg", buf, "image/jpeg")})
+
+        headers = {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head_bytes) + int(size) + len(tail_bytes)),
+        }
+        return await HTTP.post(path, content=body(), headers=headers)
+
+
+# Markdown obyekti thread-safe emas — har bir worker thread o'z nusxasini saqlaydi
+_MD_LOCAL = threading.local()
+
+
+@functools.lru_cache(maxsize=32)
+def render_markdown(text: str) -> str:
+    """Markdown -> HTML. Modul birinchi post yaratilganda, worker threadda import qilinadi"""
+    converter = getattr(_MD_LOCAL, "converter", None)
+    if converter is None:
+        import markdown
+
+        converter = _MD_LOCAL.converter = markdown.Markdown(extensions=["fenced_code", "tables"])
+    return converter.reset().convert(text)
+
+
+# Telegram caption va xabar chegaralari UTF-16 birliklarida hisoblanadi (Python belgilarida emas)
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+PREVIEW_CHARS = 400
+# Sarlavhadan keyin birinchi xabarda body uchun kamida shuncha joy qolmasa, sarlavha alohida yuboriladi
+MIN_BODY_ROOM = 500
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _truncate_u16(text: str, limit: int) -> str:
+    """Matnni `limit` UTF-16 birligiga sig'diradi, surrogat juftini bo'lmasdan"""
+    if len(text) * 2 <= limit:
+        return text
+    raw = text.encode("utf-16-le")
+    if len(raw) // 2 <= limit:
+        return text
+    # Yarim qolgan surrogat "ignore" bilan tashlanadi; osilib qolgan ZWJ/VS ham olib tashlanadi
+    return raw[: limit * 2].decode("utf-16-le", errors="ignore").rstrip("\u200d\ufe0f")
+
+
+def _split_point(piece: str) -> str:
+    """Kesish joyini ``` blokidan tashqariga va paragraf/qator/gap chegarasiga surish"""
+    if piece.count("```") % 2:
+        # Kod bloki shu bo'lakda ochilib yopilmagan — blok boshidan oldin kesiladi
+        fence = piece.rfind("```")
+        if fence > 0:
+            return piece[:fence]
+    floor = len(piece) // 2
+    for sep in ("\n\n", "\n", ". "):
+        cut = piece.rfind(sep, floor)
+        if cut != -1:
+            return piece[: cut + len(sep)]
+    return piece
+
+
+def _chunk_u16(text: str, limit: int):
+    """Matnni har biri `limit` UTF-16 birligidan oshmaydigan bo'laklarga bo'lish"""
+    if limit <= 0:
+        # Manfiy limitda _truncate_u16 deyarli butun matnni qaytarib yuborardi
+        raise ValueError(f"chunk limit must be positive, got {limit}")
+    while text:
+        piece = _truncate_u16(text, limit) or text[0]
+        if len(piece) < len(text):
+            piece = _split_point(piece)
+        yield piece
+        text = text[len(piece):]
+
+
+def build_caption(title: str, preview_source: str, tail: str) -> str:
+    """Kanal posti matni: sarlavha, qisqa preview va havola (yoki "⏳")"""
+    head = f"🆕 {title}\n\n"
+    tail = f"\n\n{tail}"
+    room = max(0, CAPTION_LIMIT - _utf16_len(head) - _utf16_len(tail))
+    return head + _truncate_u16(preview_source[:PREVIEW_CHARS], room) + tail
+
+
+async def send_to_channel(context: ContextTypes.DEFAULT_TYPE, file_id: Optional[str], caption: str):
+    if file_id:
+        return await context.bot.send_photo(chat_id=CHANNEL_ID, photo=file_id, caption=caption)
+    return await context.bot.send_message(chat_id=CHANNEL_ID, text=caption)
+
+
+async def finish_channel_placeholder(context: ContextTypes.DEFAULT_TYPE, placeholder_task, file_id: Optional[str], caption: str):
+    """Oldindan yuborilgan kanal xabariga yakuniy matnni (URL bilan) yozish"""
+    try:
+        placeholder = await placeholder_task
+    except Exception:
+        # Placeholder yuborilmagan bo'lsa, odatdagidek yangi xabar yuboriladi
+        return await send_to_channel(context, file_id, caption)
+    if file_id:
+        return await context.bot.edit_message_caption(chat_id=CHANNEL_ID, message_id=placeholder.message_id, caption=caption)
+    return await context.bot.edit_message_text(chat_id=CHANNEL_ID, message_id=placeholder.message_id, text=caption)
+
+
+async def discard_channel_placeholder(context: ContextTypes.DEFAULT_TYPE, placeholder_task):
+    if placeholder_task is None:
+        return
+    try:
+        placeholder = await placeholder_task
+        await context.bot.delete_message(chat_id=CHANNEL_ID, message_id=placeholder.message_id)
+    except Exception:
+        pass
+
+
 async def create_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = context.user_data
-    files = {}
+    file_task = None
     file_id = data.get("photo_file_id")
-    if file_id:
-        file = await context.bot.get_file(file_id)
-        image_bytes = await file.download_as_bytearray()
-        files = {"image": ("post.jpg", image_bytes)}
-    body_text = (data.get("body", "") or "").strip()
-    body_html = md.markdown(body_text, extensions=["fenced_code", "tables"])
+    if file_id and not BACKEND_FETCHES_IMAGES:
+        # get_file so'rovi markdown render bilan parallel ketadi
+        file_task = asyncio.create_task(get_tg_file(context, file_id))
+    # handle_text kiritishda strip qiladi — bu yerda qayta strip qilinmaydi
+    body_text = data.get("body") or ""
+    body_html = await asyncio.to_thread(render_markdown, body_text)
+    file = await file_task if file_task is not None else None
     payload = {
         "title": data.get("title", ""),
         "body": body_text,
@@ -735,87 +1318,134 @@ async def create_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "body_html": body_html,
         "description": data.get("description", ""),
         "category_slug": data.get("category_slug", ""),
-        "tag_slugs": ",".join(data.get("selected_tags", [])),
+        "tag_slugs": ",".join(sorted(data.get("selected_tags", set()))),
     }
+    if file_id and BACKEND_FETCHES_IMAGES:
+        # Rasmni backend Telegramdan o'zi yuklab oladi (AI draft approve dagi kabi)
+        payload["image_file_id"] = file_id
     scheduled_at = data.get("scheduled_at")
     if scheduled_at is not None:
         payload["published_date"] = scheduled_at.isoformat()
-    try:
-        resp = requests.post(
-            f"{API_BASE}/api/bot/post/",
-            headers=api_headers(),
-            data=payload,
-            files=files,
-            timeout=60,
+
+    title = data.get("title", "")
+    preview_source = data.get("description") or body_text
+    placeholder_task = None
+    if CHANNEL_ID and CHANNEL_PLACEHOLDER and scheduled_at is None:
+        # Kanal xabari backend javobini kutmasdan boshlanadi, URL keyin tahrirlab qo'shiladi
+        placeholder_task = asyncio.create_task(
+            send_to_channel(context, file_id, build_caption(title, preview_source, "⏳"))
         )
+
+    try:
+        if file is not None:
+            resp = await post_with_streamed_image("/api/bot/post/", payload, file)
+        else:
+            resp = await request_with_retry("POST", "/api/bot/post/", data=payload)
     except Exception as exc:
         # Xatolikni faqat admin ga yuborish
-        if ADMIN_CHAT_ID:
-            await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ APIga ulanishda xato: {exc}")
+        await notify_admin_error(context.bot, f"❌ APIga ulanishda xato: {exc}")
         # Foydalanuvchiga umumiy xabar
         await update.effective_chat.send_message("❌ Maqola yuborishda xatolik yuz berdi. Admin bilan bog'lanish.")
+        await discard_channel_placeholder(context, placeholder_task)
         return
-    result = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
-    if not resp.ok or not result.get("ok"):
-        err_text = resp.text
-        if len(err_text) > 1000:
-            err_text = err_text[:1000] + "..."
+    # JSON faqat muvaffaqiyatli va JSON javobda parse qilinadi
+    is_json = resp.headers.get("content-type", "").startswith("application/json")
+    result = orjson.loads(resp.content) if resp.is_success and is_json else {}
+    if not resp.is_success or not result.get("ok"):
+        if 400 <= resp.status_code < 500:
+            invalidate_meta()
+        err_text = result.get("error") or _error_preview(resp, 1000)
         # Xatolikni faqat admin ga yuborish
-        if ADMIN_CHAT_ID:
-            await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ API xato: {err_text}")
+        await notify_admin_error(context.bot, f"❌ API xato ({resp.status_code} {resp.reason_phrase}): {err_text}")
         # Foydalanuvchiga umumiy xabar
         await update.effective_chat.send_message("❌ Maqola yuborishda xatolik yuz berdi. Admin bilan bog'lanish.")
+        await discard_channel_placeholder(context, placeholder_task)
         return
 
+    if file_id:
+        _TG_FILE_CACHE.pop(file_id, None)
     post_url = result.get("url", "")
-    title = data.get("title", "")
     is_scheduled = result.get("scheduled", False)
     scheduled_date_iso = result.get("published_date", "")
 
     if is_scheduled:
         context.user_data.clear()
+        await discard_channel_placeholder(context, placeholder_task)
         try:
-            from datetime import datetime
-            dt = datetime.fromisoformat(scheduled_date_iso.replace("Z", "+00:00"))
+            dt = datetime.datetime.fromisoformat(scheduled_date_iso.replace("Z", "+00:00"))
             fmt = dt.strftime("%d.%m.%Y %H:%M")
         except Exception:
             fmt = scheduled_date_iso
         await update.effective_chat.send_message(
             f"✅ Maqola rejalashtirildi.\n\n📅 Saytga va kanalga chiqadi: <b>{fmt}</b>\n\n{post_url}",
             parse_mode="HTML",
-            reply_markup=main_reply_keyboard(),
+            reply_markup=main_kb(context),
         )
         return
 
-    description = (data.get("description", "") or "").strip()
-    body_text = (data.get("body", "") or "").strip()
-    preview_source = description if description else body_text
-    preview = preview_source[:400]
-    caption = f"🆕 {title}\n\n{preview}\n\n{post_url}"
-
-    if CHANNEL_ID:
-        if file_id:
-            await context.bot.send_photo(chat_id=CHANNEL_ID, photo=file_id, caption=caption)
-        else:
-            await context.bot.send_message(chat_id=CHANNEL_ID, text=caption)
+    caption = build_caption(title, preview_source, post_url)
 
     context.user_data.clear()
-    await update.effective_chat.send_message("✅ Maqola saytga joylandi va kanalga yuborildi.", reply_markup=main_reply_keyboard())
+    # Kanalga yuborish va foydalanuvchiga javob bir-biriga bog'liq emas — parallel yuboriladi.
+    # Javob faqat tasdiqlangan narsani aytadi (saytga joylandi); kanal xatosi alohida keladi
+    ack = update.effective_chat.send_message("✅ Maqola saytga joylandi.", reply_markup=main_kb(context))
+    if not CHANNEL_ID:
+        await ack
+        return
+    if placeholder_task is not None:
+        channel = finish_channel_placeholder(context, placeholder_task, file_id, caption)
+    else:
+        channel = send_to_channel(context, file_id, caption)
+    channel_result, ack_result = await asyncio.gather(channel, ack, return_exceptions=True)
+    if isinstance(channel_result, Exception):
+        # Xatolikni faqat admin ga yuborish
+        await notify_admin_error(context.bot, f"❌ Kanalga yuborishda xato: {channel_result}")
+        await update.effective_chat.send_message("❌ Maqola saytga joylandi, lekin kanalga yuborilmadi. Admin bilan bog'lanish.")
+    if isinstance(ack_result, Exception):
+        raise ack_result
+
+
+# "Oxirgi postlar" natijasi qisqa muddat barcha foydalanuvchilar uchun umumiy
+_RECENT_CACHE: Optional[Tuple[float, Dict[str, Dict[str, str]], Optional[InlineKeyboardMarkup]]] = None
+_RECENT_TTL = 30.0
+_RECENT_LOCK = asyncio.Lock()
+
+
+async def recent_posts_view() -> Tuple[Dict[str, Dict[str, str]], Optional[InlineKeyboardMarkup]]:
+    """Oxirgi postlar (id -> kanal uchun kerakli maydonlar) va ularning tugmalari"""
+    global _RECENT_CACHE
+    if _RECENT_CACHE and time.monotonic() - _RECENT_CACHE[0] < _RECENT_TTL:
+        return _RECENT_CACHE[1], _RECENT_CACHE[2]
+    async with _RECENT_LOCK:
+        if _RECENT_CACHE and time.monotonic() - _RECENT_CACHE[0] < _RECENT_TTL:
+            return _RECENT_CACHE[1], _RECENT_CACHE[2]
+        payload = await fetch_recent_posts(limit=10)
+        posts = payload.get("posts", [])
+        # send_post_to_channel faqat title/url/excerpt ishlatadi — qolgan maydonlar saqlanmaydi
+        by_id = {
+            str(p["id"]): {"title": p.get("title", ""), "url": p.get("url", ""), "excerpt": p.get("excerpt", "")}
+            for p in posts
+        }
+        markup = None
+        if posts:
+            markup = InlineKeyboardMarkup(
+                [[InlineKeyboardButton(p["title"], callback_data=f"postid:{p['id']}")] for p in posts]
+            )
+        _RECENT_CACHE = (time.monotonic(), by_id, markup)
+        return by_id, markup
 
 
 async def show_recent_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        payload = fetch_recent_posts(limit=10)
+        by_id, markup = await recent_posts_view()
     except Exception as exc:
-        await update.message.reply_text(f"❌ Postlar yuklanmadi: {exc}", reply_markup=main_reply_keyboard())
+        await update.message.reply_text(f"❌ Postlar yuklanmadi: {exc}", reply_markup=main_kb(context))
         return
-    posts = payload.get("posts", [])
-    if not posts:
-        await update.message.reply_text("Postlar topilmadi.", reply_markup=main_reply_keyboard())
+    if not by_id:
+        await update.message.reply_text("Postlar topilmadi.", reply_markup=main_kb(context))
         return
-    context.user_data["recent_posts"] = {str(p["id"]): p for p in posts}
-    buttons = [[InlineKeyboardButton(p["title"], callback_data=f"postid:{p['id']}")] for p in posts]
-    await update.message.reply_text("Kanalga yuborish uchun postni tanlang:", reply_markup=InlineKeyboardMarkup(buttons))
+    context.user_data["recent_posts"] = by_id
+    await update.message.reply_text("Kanalga yuborish uchun postni tanlang:", reply_markup=markup)
 
 
 async def send_post_to_channel(update: Update, context: ContextTypes.DEFAULT_TYPE, post: Dict[str, Any]):
@@ -828,38 +1458,46 @@ async def send_post_to_channel(update: Update, context: ContextTypes.DEFAULT_TYP
     title = post.get("title", "")
     url = post.get("url", "")
     excerpt = (post.get("excerpt", "") or "").strip()
-    preview = excerpt[:400] if excerpt else ""
-    caption = f"🆕 {title}\n\n{preview}\n\n{url}"
-    await update.effective_chat.send_message("⏳ Kanalga yuborilmoqda...")
+    caption = build_caption(title, excerpt, url)
+    # Tasdiq faqat kanal posti muvaffaqiyatli chiqqandan keyin yuboriladi — aks holda
+    # foydalanuvchi avval "yuborildi", keyin "yuborilmadi" xabarini o'qigan bo'lardi
     try:
-        # Faqat maqolani kanalga yuborish
         await context.bot.send_message(chat_id=CHANNEL_ID, text=caption)
-        await update.effective_chat.send_message("✅ Kanalga yuborildi.", reply_markup=main_reply_keyboard())
     except Exception as exc:
         # Xatolikni faqat admin ga yuborish
-        if ADMIN_CHAT_ID:
-            await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Kanalga yuborishda xato: {exc}")
+        await notify_admin_error(context.bot, f"❌ Kanalga yuborishda xato: {exc}")
         await update.effective_chat.send_message("❌ Kanalga yuborishda xatolik yuz berdi. Admin bilan bog'lanish.")
+        return
+    await update.effective_chat.send_message("✅ Kanalga yuborildi.", reply_markup=main_kb(context))
+
+
+# Admin javob bermagan daily pick postlari shuncha vaqt saqlanadi (sekund)
+DAILY_CACHE_TTL = 48 * 3600
 
 
 async def send_daily_pick_to_admin(context: ContextTypes.DEFAULT_TYPE):
     if not ADMIN_CHAT_ID:
         return
     try:
-        payload = fetch_daily_pick()
+        payload = await fetch_daily_pick()
     except Exception as exc:
-        await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Daily pick xato: {exc}")
+        await notify_admin_error(context.bot, f"❌ Daily pick xato: {exc}")
         return
     if not payload.get("ok"):
-        await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Daily pick xato: {payload}")
+        await notify_admin_error(context.bot, f"❌ Daily pick xato: {payload}")
         return
     pick_id = payload.get("pick_id")
     post = payload.get("post", {})
+    # Admin qaroriga qadar postni saqlab qo'yamiz — "sent" da qayta so'ralmaydi
+    cache = context.bot_data.setdefault("daily_cache", {})
+    now = time.time()
+    for stale_id in [k for k, (ts, _) in cache.items() if now - ts > DAILY_CACHE_TTL]:
+        del cache[stale_id]
+    cache[pick_id] = (now, post)
     title = post.get("title", "")
     url = post.get("url", "")
     excerpt = (post.get("excerpt", "") or "").strip()
-    preview = excerpt[:400]
-    caption = f"🆕 {title}\n\n{preview}\n\n{url}"
+    caption = build_caption(title, excerpt, url)
     buttons = [
         [
             InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"daily:sent:{pick_id}"),
@@ -879,51 +1517,57 @@ async def handle_daily_decision(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     # "sent" bo'lsa, avval post ma'lumotlarini olish (mark_daily_pick chaqirilishidan oldin)
-    post = None
-    if action == "sent":
+    daily_cache = context.bot_data.get("daily_cache", {})
+    cached = daily_cache.get(pick_id)
+    post = cached[1] if cached else None
+    mark = mark_daily_pick
+    if action == "sent" and not post and DAILY_MARK_AND_FETCH:
+        # Post mark javobining o'zida keladi — alohida fetch kerak emas
+        mark = mark_and_fetch_daily
+    elif action == "sent" and not post:
         try:
             # Post ma'lumotlarini API dan olish (mark_daily_pick chaqirilishidan oldin)
-            post_payload = fetch_daily_pick()
+            post_payload = await fetch_daily_pick()
             if post_payload.get("ok") and post_payload.get("pick_id") == pick_id:
                 post = post_payload.get("post", {})
         except Exception as exc:
             # Xatolikni faqat admin ga yuborish
-            if ADMIN_CHAT_ID:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Post ma'lumotlarini olishda xato: {exc}")
+            await notify_admin_error(context.bot, f"❌ Post ma'lumotlarini olishda xato: {exc}")
     
     # Endi mark_daily_pick ni chaqirish
     try:
-        mark_daily_pick(pick_id, action)
+        result = await mark(pick_id, action)
     except Exception as exc:
         # Xatolikni faqat admin ga yuborish
-        if ADMIN_CHAT_ID:
-            await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Mark xato: {exc}")
+        await notify_admin_error(context.bot, f"❌ Mark xato: {exc}")
         await update.effective_chat.send_message("❌ Xatolik yuz berdi. Admin bilan bog'lanish.")
         return
+    daily_cache.pop(pick_id, None)
+    post = post or result.get("post")
     
     if action == "sent":
         if not post:
             # Agar post ma'lumotlari olinmagan bo'lsa, xatolik yuborish
-            if ADMIN_CHAT_ID:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Post ma'lumotlari olinmadi (pick_id: {pick_id})")
+            await notify_admin_error(context.bot, f"❌ Post ma'lumotlari olinmadi (pick_id: {pick_id})")
             await update.effective_chat.send_message("❌ Kanalga yuborishda xatolik yuz berdi. Admin bilan bog'lanish.")
             return
         
-        await update.effective_chat.send_message("⏳ Kanalga yuborilmoqda...")
         try:
             # Faqat maqolani kanalga yuborish
             await send_post_to_channel(update, context, post)
         except Exception as exc:
             # Xatolikni faqat admin ga yuborish
-            if ADMIN_CHAT_ID:
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Daily pick kanalga yuborishda xato: {exc}")
+            await notify_admin_error(context.bot, f"❌ Daily pick kanalga yuborishda xato: {exc}")
             await update.effective_chat.send_message("❌ Kanalga yuborishda xatolik yuz berdi. Admin bilan bog'lanish.")
     else:
-        await update.effective_chat.send_message("❌ Post rad etildi.", reply_markup=main_reply_keyboard())
+        await update.effective_chat.send_message("❌ Post rad etildi.", reply_markup=main_kb(context))
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     err = context.error
+    # main_kb() bayroqni markup yasalganda qo'yadi; handler xato bilan tugagan bo'lsa,
+    # o'sha xabar yetib bormagan bo'lishi mumkin
+    reset_main_kb(context)
 
     # 1) "Message is not modified" — xabar va tugmalar o'zgarmaganda Telegram BadRequest qaytaradi; e'tiborsiz qoldiramiz
     if isinstance(err, BadRequest) and "message is not modified" in str(err).lower():
@@ -952,14 +1596,13 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     if len(msg) > 1000:
         msg = msg[:1000] + "..."
     try:
-        # Xatolikni faqat admin ga yuborish
-        if ADMIN_CHAT_ID:
-            await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=msg)
+        # Xatolikni faqat admin ga yuborish (uzilish paytida bir xil xatolar jamlanadi)
+        await notify_admin_error(context.bot, msg)
         # Foydalanuvchiga umumiy xabar (agar update mavjud bo'lsa va kanal emas bo'lsa)
         if update and hasattr(update, "effective_chat") and update.effective_chat:
             chat_id = update.effective_chat.id
             # Kanal ID negativ bo'ladi, shuning uchun tekshiramiz
-            if CHANNEL_ID and str(chat_id) != str(CHANNEL_ID):
+            if CHANNEL_ID and str(chat_id) != CHANNEL_ID:
                 try:
                     await update.effective_chat.send_message("❌ Bot xatosi yuz berdi. Admin bilan bog'lanish.")
                 except Exception:
@@ -973,72 +1616,71 @@ async def ai_post_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["ai_mode"] = "await_topic"
 
 
+@admin_only
 async def ai_draft_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manual AI draft yaratish"""
-    if not ADMIN_CHAT_ID or str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
-        await update.message.reply_text("❌ Bu funksiya faqat admin uchun.")
-        return
-    
     await update.message.reply_text(
         "🤖 AI draft yaratish uchun mavzuni yuboring:\n\n"
         "Masalan: 'Python decoratorlar haqida', 'Django ORM optimizatsiyasi', va hokazo."
     )
-    context.user_data["ai_draft_manual"] = True
-    context.user_data["ai_draft_mode"] = "await_topic"
+    context.user_data.update(ai_draft_manual=True, ai_draft_mode="await_topic")
+
+
+def numbered_list(items: List[str], limit: Optional[int] = None) -> str:
+    """"1. ..." qatorlari bir join bilan; limit dan oshgani "... va yana N ta" bo'ladi"""
+    shown = items if limit is None else items[:limit]
+    lines = [f"{i}. {item}\n" for i, item in enumerate(shown, 1)]
+    if len(items) > len(shown):
+        lines.append(f"... va yana {len(items) - len(shown)} ta\n")
+    return "".join(lines)
+
+
+# /ai_settings va /ai_trends tugmalari o'zgarmaydi — bir marta yasaladi
+AI_SETTINGS_KB = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("✏️ Sozlama o'zgartirish", callback_data="aisettings:edit_instructions")],
+        [InlineKeyboardButton("📊 Trend qo'shish", callback_data="aisettings:add_trend")],
+        [InlineKeyboardButton("📊 Trendlar ro'yxati", callback_data="aisettings:list_trends")],
+        [InlineKeyboardButton("📌 Mavzu qo'shish", callback_data="aisettings:add_topic")],
+        [InlineKeyboardButton("📌 Mavzular ro'yxati", callback_data="aisettings:list_topics")],
+    ]
+)
+AI_TRENDS_KB = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("➕ Yangi trend", callback_data="aitrend:add")],
+        [InlineKeyboardButton("🗑️ Trend o'chirish", callback_data="aitrend:delete")],
+    ]
+)
 
 
+@admin_only
 async def ai_settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """AI sozlamalarini ko'rish va o'zgartirish"""
-    if not ADMIN_CHAT_ID or str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
-        await update.message.reply_text("❌ Bu funksiya faqat admin uchun.")
-        return
-    
     settings = get_ai_settings()
     
+    trends = settings.get('trends', [])
+    topics = settings.get('topics', [])
+    # Ro'yxatlardan faqat birinchi 5 tasi ko'rsatiladi
+    trends_text = numbered_list(trends, 5) or "Trendlar yo'q\n"
     msg = (
         f"🤖 *AI Sozlamalar:*\n\n"
         f"📝 *Hozirgi sozlama:*\n{settings['instructions']}\n\n"
-        f"📊 *Trendlar ({len(settings.get('trends', []))}):*\n"
+        f"📊 *Trendlar ({len(trends)}):*\n"
+        f"{trends_text}"
+        f"\n📌 *Mavzular ({len(topics)}):*\n"
+        f"{numbered_list(topics, 5)}"
     )
     
-    trends = settings.get('trends', [])
-    if trends:
-        for i, trend in enumerate(trends[:5], 1):  # Faqat birinchi 5 tasini ko'rsatish
-            msg += f"{i}. {trend}\n"
-        if len(trends) > 5:
-            msg += f"... va yana {len(trends) - 5} ta\n"
-    else:
-        msg += "Trendlar yo'q\n"
-    
-    msg += f"\n📌 *Mavzular ({len(settings.get('topics', []))}):*\n"
-    topics = settings.get('topics', [])
-    if topics:
-        for i, topic in enumerate(topics[:5], 1):
-            msg += f"{i}. {topic}\n"
-        if len(topics) > 5:
-            msg += f"... va yana {len(topics) - 5} ta\n"
-    
-    buttons = [
-        [InlineKeyboardButton("✏️ Sozlama o'zgartirish", callback_data="aisettings:edit_instructions")],
-        [InlineKeyboardButton("📊 Trend qo'shish", callback_data="aisettings:add_trend")],
-        [InlineKeyboardButton("📊 Trendlar ro'yxati", callback_data="aisettings:list_trends")],
-        [InlineKeyboardButton("📌 Mavzu qo'shish", callback_data="aisettings:add_topic")],
-        [InlineKeyboardButton("📌 Mavzular ro'yxati", callback_data="aisettings:list_topics")],
-    ]
-    
     await update.message.reply_text(
         msg,
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(buttons),
+        reply_markup=AI_SETTINGS_KB,
     )
 
 
+@admin_only
 async def ai_trends_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Trendlarni boshqarish"""
-    if not ADMIN_CHAT_ID or str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
-        await update.message.reply_text("❌ Bu funksiya faqat admin uchun.")
-        return
-    
     settings = get_ai_settings()
     trends = settings.get('trends', [])
     
@@ -1050,19 +1692,16 @@ async def ai_trends_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["ai_trend_mode"] = "add"
         return
     
-    msg = f"📊 *Trendlar ({len(trends)}):*\n\n"
-    for i, trend in enumerate(trends, 1):
-        msg += f"{i}. {trend}\n"
-    
-    buttons = [
-        [InlineKeyboardButton("➕ Yangi trend", callback_data="aitrend:add")],
-        [InlineKeyboardButton("🗑️ Trend o'chirish", callback_data="aitrend:delete")],
-    ]
+    msg = f"📊 *Trendlar ({len(trends)}):*\n\n" + numbered_list(trends)
     
+    # Ro'yxat 4096 belgidan oshsa, qator chegarasida bo'linadi; tugmalar oxirgi xabarda
+    *head, last = _chunk_u16(msg, MESSAGE_LIMIT)
+    for part in head:
+        await update.message.reply_text(part, parse_mode="Markdown")
     await update.message.reply_text(
-        msg,
+        last,
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(buttons),
+        reply_markup=AI_TRENDS_KB,
     )
 
 
@@ -1071,7 +1710,6 @@ async def generate_ai_draft(context: ContextTypes.DEFAULT_TYPE):
     if not ADMIN_CHAT_ID:
         return
     
-    import random
     settings = get_ai_settings()
     topics = settings.get('topics', AI_TOPICS)
     topic = random.choice(topics)
@@ -1084,9 +1722,9 @@ async def generate_ai_draft(context: ContextTypes.DEFAULT_TYPE):
         instructions = instructions + trends_text
     
     try:
-        resp = requests.post(
-            f"{API_BASE}/api/bot/ai/draft/create/",
-            headers=api_headers(),
+        resp = await request_with_retry(
+            "POST",
+            "/api/bot/ai/draft/create/",
             data={
                 "topic": topic,
                 "instructions": instructions,
@@ -1094,20 +1732,7 @@ async def generate_ai_draft(context: ContextTypes.DEFAULT_TYPE):
             timeout=180,
         )
         
-        # Response status code tekshirish
-        if not resp.ok:
-            error_text = resp.text[:500] if resp.text else "Unknown error"
-            raise Exception(f"API error ({resp.status_code}): {error_text}")
-        
-        # JSON parsing xatolarini handle qilish
-        try:
-            data = resp.json()
-        except ValueError as json_err:
-            error_text = resp.text[:500] if resp.text else "Empty response"
-            raise Exception(f"JSON parsing error: {json_err}. Response: {error_text}")
-        
-        if not data.get("ok"):
-            raise Exception(data.get("error") or resp.text)
+        data = api_json(resp)
         
         draft_id = data.get("draft_id")
         title = data.get("title")
@@ -1127,24 +1752,14 @@ async def generate_ai_draft(context: ContextTypes.DEFAULT_TYPE):
             f"Draft ID: {draft_id}"
         )
         
-        buttons = [
-            [
-                InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"aidraft:approve:{draft_id}"),
-                InlineKeyboardButton("❌ Rad etish", callback_data=f"aidraft:reject:{draft_id}"),
-            ],
-            [
-                InlineKeyboardButton("🔄 Qayta generatsiya", callback_data=f"aidraft:regenerate:{draft_id}"),
-            ],
-        ]
-        
         await context.bot.send_message(
             chat_id=ADMIN_CHAT_ID,
             text=msg,
             parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(buttons),
+            reply_markup=ai_draft_keyboard(draft_id),
         )
         
-    except requests.exceptions.RequestException as exc:
+    except httpx.HTTPError as exc:
         if ADMIN_CHAT_ID:
             await context.bot.send_message(
                 chat_id=ADMIN_CHAT_ID,
@@ -1160,32 +1775,24 @@ async def generate_ai_draft(context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_ai_draft_decision(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, draft_id: int):
     """AI Draft tasdiqlash/rad etish/qayta generatsiya"""
+    # Draft holati o'zgaradi — keshdagi nusxasi endi qayta ko'rsatilmaydi
+    forget_ai_draft(draft_id)
     
     if action == "approve":
         # Draftni olish va kategoriya tanlash uchun yuborish
         try:
-            resp = requests.get(
-                f"{API_BASE}/api/bot/ai/draft/get/",
-                headers=api_headers(),
+            resp = await request_with_retry(
+                "GET",
+                "/api/bot/ai/draft/get/",
                 params={"draft_id": draft_id},
                 timeout=30,
             )
             
-            if not resp.ok:
-                error_text = resp.text[:500] if resp.text else "Unknown error"
-                raise Exception(f"API error ({resp.status_code}): {error_text}")
-            
-            try:
-                data = resp.json()
-            except ValueError as json_err:
-                error_text = resp.text[:500] if resp.text else "Empty response"
-                raise Exception(f"JSON parsing error: {json_err}. Response: {error_text}")
-            
-            if not data.get("ok"):
-                raise Exception(data.get("error") or resp.text)
+            data = api_json(resp)
             
             # Meta olish (categories, tags)
-            meta = fetch_meta()
+            meta = await fetch_meta()
+            context.user_data["all_categories"] = meta["categories"]
             
             # Kategoriya tanlash uchun yuborish
             await update.effective_chat.send_message(
@@ -1194,8 +1801,7 @@ async def handle_ai_draft_decision(update: Update, context: ContextTypes.DEFAULT
             )
             
             # Context'ga saqlash
-            context.user_data["ai_draft_id"] = draft_id
-            context.user_data["ai_draft_step"] = "category"
+            context.user_data.update(ai_draft_id=draft_id, ai_draft_step="category", ai_draft_started=time.time())
             
         except Exception as exc:
             error_msg = str(exc)
@@ -1205,27 +1811,15 @@ async def handle_ai_draft_decision(update: Update, context: ContextTypes.DEFAULT
     
     elif action == "reject":
         try:
-            resp = requests.post(
-                f"{API_BASE}/api/bot/ai/draft/reject/",
-                headers=api_headers(),
+            resp = await request_with_retry(
+                "POST",
+                "/api/bot/ai/draft/reject/",
                 data={"draft_id": draft_id},
                 timeout=30,
             )
             
-            if not resp.ok:
-                error_text = resp.text[:500] if resp.text else "Unknown error"
-                raise Exception(f"API error ({resp.status_code}): {error_text}")
-            
-            try:
-                data = resp.json()
-            except ValueError as json_err:
-                error_text = resp.text[:500] if resp.text else "Empty response"
-                raise Exception(f"JSON parsing error: {json_err}. Response: {error_text}")
-            
-            if data.get("ok"):
-                await update.effective_chat.send_message("❌ Draft rad etildi.")
-            else:
-                await update.effective_chat.send_message(f"❌ Xato: {data.get('error', 'Unknown error')}")
+            api_json(resp)
+            await update.effective_chat.send_message("❌ Draft rad etildi.")
         except Exception as exc:
             error_msg = str(exc)
             if len(error_msg) > 1000:
@@ -1235,25 +1829,14 @@ async def handle_ai_draft_decision(update: Update, context: ContextTypes.DEFAULT
     elif action == "regenerate":
         await update.effective_chat.send_message("🔄 Qayta generatsiya qilinmoqda...")
         try:
-            resp = requests.post(
-                f"{API_BASE}/api/bot/ai/draft/regenerate/",
-                headers=api_headers(),
+            resp = await request_with_retry(
+                "POST",
+                "/api/bot/ai/draft/regenerate/",
                 data={"draft_id": draft_id},
                 timeout=180,
             )
             
-            if not resp.ok:
-                error_text = resp.text[:500] if resp.text else "Unknown error"
-                raise Exception(f"API error ({resp.status_code}): {error_text}")
-            
-            try:
-                data = resp.json()
-            except ValueError as json_err:
-                error_text = resp.text[:500] if resp.text else "Empty response"
-                raise Exception(f"JSON parsing error: {json_err}. Response: {error_text}")
-            
-            if not data.get("ok"):
-                raise Exception(data.get("error") or resp.text)
+            data = api_json(resp)
             
             # Yangi draftni admin'ga yuborish
             title = data.get("title")
@@ -1268,20 +1851,10 @@ async def handle_ai_draft_decision(update: Update, context: ContextTypes.DEFAULT
                 f"Draft ID: {draft_id}"
             )
             
-            buttons = [
-                [
-                    InlineKeyboardButton("✅ Tasdiqlash", callback_data=f"aidraft:approve:{draft_id}"),
-                    InlineKeyboardButton("❌ Rad etish", callback_data=f"aidraft:reject:{draft_id}"),
-                ],
-                [
-                    InlineKeyboardButton("🔄 Qayta generatsiya", callback_data=f"aidraft:regenerate:{draft_id}"),
-                ],
-            ]
-            
             await update.effective_chat.send_message(
                 msg,
                 parse_mode="Markdown",
-                reply_markup=InlineKeyboardMarkup(buttons),
+                reply_markup=ai_draft_keyboard(draft_id),
             )
         except Exception as exc:
             await update.effective_chat.send_message(f"❌ Xato: {exc}")
@@ -1310,10 +1883,9 @@ async def handle_ai_settings_callback(update: Update, context: ContextTypes.DEFA
         if not trends:
             await update.effective_chat.send_message("📊 Trendlar yo'q.")
         else:
-            msg = f"📊 *Trendlar ({len(trends)}):*\n\n"
-            for i, trend in enumerate(trends, 1):
-                msg += f"{i}. {trend}\n"
-            await update.effective_chat.send_message(msg, parse_mode="Markdown")
+            msg = f"📊 *Trendlar ({len(trends)}):*\n\n" + numbered_list(trends)
+            for part in _chunk_u16(msg, MESSAGE_LIMIT):
+                await update.effective_chat.send_message(part, parse_mode="Markdown")
     
     elif action == "add_topic":
         await update.callback_query.answer()
@@ -1327,10 +1899,32 @@ async def handle_ai_settings_callback(update: Update, context: ContextTypes.DEFA
         if not topics:
             await update.effective_chat.send_message("📌 Mavzular yo'q.")
         else:
-            msg = f"📌 *Mavzular ({len(topics)}):*\n\n"
-            for i, topic in enumerate(topics, 1):
-                msg += f"{i}. {topic}\n"
-            await update.effective_chat.send_message(msg, parse_mode="Markdown")
+            msg = f"📌 *Mavzular ({len(topics)}):*\n\n" + numbered_list(topics)
+            for part in _chunk_u16(msg, MESSAGE_LIMIT):
+                await update.effective_chat.send_message(part, parse_mode="Markdown")
+
+
+# O'chirish klaviaturasida bir sahifadagi trendlar soni (Telegram tugmalar soni cheklangan)
+TREND_PAGE = 10
+
+
+def trend_delete_keyboard(trends: List[str], page: int) -> InlineKeyboardMarkup:
+    pages = max(1, -(-len(trends) // TREND_PAGE))
+    page = min(max(page, 0), pages - 1)
+    start = page * TREND_PAGE
+    buttons = [
+        [InlineKeyboardButton(f"🗑️ {trend[:30]}...", callback_data=f"aitrend:del:{i}")]
+        for i, trend in enumerate(trends[start:start + TREND_PAGE], start)
+    ]
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=f"aitrend:page:{page - 1}"))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton("▶️", callback_data=f"aitrend:page:{page + 1}"))
+    if nav:
+        buttons.append(nav)
+    buttons.append([InlineKeyboardButton("❌ Bekor qilish", callback_data="aitrend:cancel")])
+    return InlineKeyboardMarkup(buttons)
 
 
 async def handle_ai_trends_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
@@ -1350,19 +1944,16 @@ async def handle_ai_trends_callback(update: Update, context: ContextTypes.DEFAUL
             return
         
         # Inline keyboard bilan trend tanlash
-        buttons = []
-        for i, trend in enumerate(trends):
-            buttons.append([
-                InlineKeyboardButton(
-                    f"🗑️ {trend[:30]}...",
-                    callback_data=f"aitrend:del:{i}"
-                )
-            ])
-        buttons.append([InlineKeyboardButton("❌ Bekor qilish", callback_data="aitrend:cancel")])
-        
         await update.effective_chat.send_message(
             "🗑️ O'chirish uchun trendni tanlang:",
-            reply_markup=InlineKeyboardMarkup(buttons),
+            reply_markup=trend_delete_keyboard(trends, 0),
+        )
+    
+    elif action.startswith("page:"):
+        await update.callback_query.answer()
+        trends = get_ai_settings().get('trends', [])
+        await update.callback_query.edit_message_reply_markup(
+            reply_markup=trend_delete_keyboard(trends, int(action.split(":")[1])),
         )
     
     elif action.startswith("del:"):
@@ -1373,7 +1964,7 @@ async def handle_ai_trends_callback(update: Update, context: ContextTypes.DEFAUL
         if 0 <= idx < len(trends):
             deleted = trends.pop(idx)
             settings['trends'] = trends
-            if save_ai_settings(settings):
+            if await save_ai_settings(settings):
                 await update.effective_chat.send_message(f"✅ Trend o'chirildi: {deleted}")
             else:
                 await update.effective_chat.send_message("❌ Xatolik: Sozlamalar saqlanmadi.")
@@ -1384,84 +1975,175 @@ async def handle_ai_trends_callback(update: Update, context: ContextTypes.DEFAUL
         await update.callback_query.answer("Bekor qilindi")
 
 
+# AI draft yakunlangach user_data dan o'chiriladigan kalitlar
+AI_DRAFT_STATE_KEYS = (
+    "ai_draft_id",
+    "ai_draft_started",
+    "ai_draft_step",
+    "ai_draft_category_slug",
+    "ai_draft_category_id",
+    "selected_tags",
+    "ai_draft_photo_file_id",
+    "all_tags",
+    "all_categories",
+)
+
+
+# Tugallanmagan AI draft holati shuncha vaqtdan keyin user_data dan tozalanadi (soniya).
+# time.time() ishlatiladi: holat pickle orqali restartdan keyin ham saqlanadi
+AI_DRAFT_STATE_TTL = 30 * 60
+
+
+async def purge_stale_ai_drafts(context: ContextTypes.DEFAULT_TYPE):
+    """Tashlab ketilgan AI draft holatini (all_tags, all_categories va h.k.) tozalash"""
+    cutoff = time.time() - AI_DRAFT_STATE_TTL
+    user_data = context.application.user_data
+    stale = [uid for uid, data in user_data.items() if data.get("ai_draft_started", cutoff) < cutoff]
+    for uid in stale:
+        for key in AI_DRAFT_STATE_KEYS:
+            user_data[uid].pop(key, None)
+    if stale:
+        context.application.mark_data_for_update_persistence(user_ids=stale)
+
+
 async def finalize_ai_draft_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """AI Draftni post qilib yaratish"""
     draft_id = context.user_data.get("ai_draft_id")
     category_slug = context.user_data.get("ai_draft_category_slug")
-    selected_tags = context.user_data.get("selected_tags", [])
+    category_id = context.user_data.get("ai_draft_category_id")
+    selected_tags = context.user_data.get("selected_tags", set())
     photo_file_id = context.user_data.get("ai_draft_photo_file_id", "")
     
     if not draft_id or not category_slug:
         await update.message.reply_text("❌ Ma'lumotlar to'liq emas.")
         return
     
-    # Category ID olish
-    meta = fetch_meta()
-    category = next((c for c in meta["categories"] if c["slug"] == category_slug), None)
-    if not category:
-        await update.message.reply_text("❌ Kategoriya topilmadi.")
-        return
+    if category_id is None:
+        # Faqat slug saqlangan bo'lsa (eski holat) — ID meta dan olinadi
+        meta = await fetch_meta()
+        category = meta["categories_by_slug"].get(category_slug)
+        if not category:
+            invalidate_meta()
+            await update.message.reply_text("❌ Kategoriya topilmadi.")
+            return
+        category_id = category["id"]
     
     # Tag IDs
-    tag_ids = ",".join(selected_tags) if selected_tags else ""
+    tag_ids = ",".join(sorted(selected_tags))
     
     # Post yaratish
     await update.message.reply_text("⏳ Post yaratilmoqda...")
     
     try:
-        resp = requests.post(
-            f"{API_BASE}/api/bot/ai/draft/approve/",
-            headers=api_headers(),
+        resp = await request_with_retry(
+            "POST",
+            "/api/bot/ai/draft/approve/",
             data={
                 "draft_id": draft_id,
-                "category_id": category["id"],
+                "category_id": category_id,
                 "tag_ids": tag_ids,
                 "image_file_id": photo_file_id or "",
             },
             timeout=60,
         )
         
-        if not resp.ok:
-            error_text = resp.text[:500] if resp.text else "Unknown error"
-            raise Exception(f"API error ({resp.status_code}): {error_text}")
-        
-        try:
-            data = resp.json()
-        except ValueError as json_err:
-            error_text = resp.text[:500] if resp.text else "Empty response"
-            raise Exception(f"JSON parsing error: {json_err}. Response: {error_text}")
-        
-        if not data.get("ok"):
-            raise Exception(data.get("error") or resp.text)
+        data = api_json(resp)
         
         post_url = data.get("url")
         post_title = data.get("title")
         
-        # Kanalga yuborish
-        if CHANNEL_ID:
-            caption = f"🆕 {post_title}\n\n{post_url}"
-            if photo_file_id:
-                await context.bot.send_photo(chat_id=CHANNEL_ID, photo=photo_file_id, caption=caption)
-            else:
-                await context.bot.send_message(chat_id=CHANNEL_ID, text=caption)
-        
         # Context tozalash
-        context.user_data.pop("ai_draft_id", None)
-        context.user_data.pop("ai_draft_step", None)
-        context.user_data.pop("ai_draft_category_slug", None)
-        context.user_data.pop("selected_tags", None)
-        context.user_data.pop("ai_draft_photo_file_id", None)
-        context.user_data.pop("all_tags", None)
+        for key in AI_DRAFT_STATE_KEYS:
+            context.user_data.pop(key, None)
         
-        await update.message.reply_text(
-            f"✅ Post saytga joylandi va kanalga yuborildi!\n\n{post_url}",
-            reply_markup=main_reply_keyboard(),
+        # Kanalga yuborish va foydalanuvchiga javob parallel (create_post dagi kabi);
+        # javob faqat tasdiqlangan natijani aytadi, kanal xatosi alohida xabar bilan keladi
+        ack = update.message.reply_text(
+            f"✅ Post saytga joylandi!\n\n{post_url}",
+            reply_markup=main_kb(context),
         )
+        if not CHANNEL_ID:
+            await ack
+            return
+        channel = send_to_channel(context, photo_file_id, f"🆕 {post_title}\n\n{post_url}")
+        channel_result, ack_result = await asyncio.gather(channel, ack, return_exceptions=True)
+        if isinstance(channel_result, Exception):
+            await notify_admin_error(context.bot, f"❌ Kanalga yuborishda xato: {channel_result}")
+            await update.message.reply_text("❌ Post saytga joylandi, lekin kanalga yuborilmadi. Admin bilan bog'lanish.")
+        if isinstance(ack_result, Exception):
+            raise ack_result
         
     except Exception as exc:
+        reset_main_kb(context)
         await update.message.reply_text(f"❌ Xato: {exc}")
 
 
+# Bitta chatda shuncha update ishlanayotgan/navbatda bo'lsa, yangi tugma bosishlar
+# javob bilan rad etiladi (xabarlar hech qachon tashlanmaydi)
+CHAT_BACKLOG = 3
+# Umumiy slotlar soni faol chatlar sonidan ancha ko'p — navbatdagi xabarlar slot
+# band qilsa ham, boshqa chatlarga joy qoladi
+MAX_CONCURRENT_UPDATES = 256
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Turli chatlarning update'lari parallel, bitta chat ichida esa navbat bilan.
+
+    Standartda PTB update'larni ketma-ket ishlaydi: bir chatdagi 180s lik AI
+    so'rovi boshqa chatlarning tugmalarini ham kuttirib qo'yadi.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # chat_id -> [lock, shu chatdan kutayotgan/ishlayotgan update'lar soni]
+        self._chats: Dict[int, list] = {}
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        entry = self._chats.setdefault(chat.id, [asyncio.Lock(), 0])
+        # process_update (final) semafor slotini do_process_update dan OLDIN oladi:
+        # chat lockini kutayotgan update ham slotni band qiladi. Xabarlar (uzun maqola
+        # bo'laklari, /cancel, pastki tugmalar) doim navbatga qo'yiladi — slotlar
+        # MAX_CONCURRENT_UPDATES bilan yetarli qilingan. Faqat tugma bosishlar
+        # (callback) navbat to'lganda javob bilan rad etiladi.
+        if update.callback_query and entry[1] >= CHAT_BACKLOG:
+            coroutine.close()
+            try:
+                await update.callback_query.answer("⏳ Oldingi amal hali tugamadi.")
+            except Exception:
+                pass
+            return
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+# Pastki klaviatura tugmalari -> handler
+BUTTON_DISPATCH = {
+    BTN_NEW: start,
+    BTN_RECENT: show_recent_posts,
+    BTN_STATUS: status,
+    BTN_BACK: back,
+    BTN_SKIP: skip_button,
+    BTN_CANCEL: cancel,
+    BTN_BODY_DONE: body_done,
+}
+
+
 def main():
     if not TG_TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN is required.")
@@ -1470,13 +2152,37 @@ def main():
     if not API_BASE:
         raise RuntimeError("API_BASE is required.")
 
-    app = ApplicationBuilder().token(TG_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TG_TOKEN)
+        # Telegram limitlari (30 msg/s umumiy, guruh/kanalga 20 msg/min) kutubxona tomonidan ushlab turiladi
+        .rate_limiter(
+            AIORateLimiter(
+                overall_max_rate=30,
+                overall_time_period=1,
+                group_max_rate=20,
+                group_time_period=60,
+                max_retries=3,
+            )
+        )
+        # Chiquvchi API chaqiruvlari va getUpdates alohida pullarda — cron joblar pollingni band qilmaydi
+        .connection_pool_size(32)
+        .pool_timeout(10)
+        .get_updates_connection_pool_size(4)
+        .get_updates_pool_timeout(30)
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .persistence(PicklePersistence(filepath=BOT_STATE_FILE, update_interval=5))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("new", start))
     app.add_handler(CommandHandler("ai_post", ai_post_command))
     app.add_handler(CommandHandler("ai_draft", ai_draft_command))
     app.add_handler(CommandHandler("ai_settings", ai_settings_command))
     app.add_handler(CommandHandler("ai_trends", ai_trends_command))
     app.add_handler(CommandHandler("status", status))
+    app.add_handler(CommandHandler("reload_meta", reload_meta))
     app.add_handler(CommandHandler("cancel", cancel))
     app.add_handler(CommandHandler("back", back))
     app.add_handler(CommandHandler("skip", skip_image))
@@ -1484,25 +2190,26 @@ def main():
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     app.add_handler(CallbackQueryHandler(handle_callback))
     app.add_error_handler(error_handler)
-    try:
-        hour, minute = DAILY_TIME.split(":")
-        daily_time = datetime.time(int(hour), int(minute))
-        tz = ZoneInfo(DAILY_TZ)
-        app.job_queue.run_daily(send_daily_pick_to_admin, time=daily_time, timezone=tz)
-    except Exception:
-        pass
+    app.job_queue.run_daily(send_daily_pick_to_admin, time=DAILY_AT, timezone=TZ)
     
     # Kunda 2 marta AI draft generatsiya
-    for time_str in AI_POST_TIMES:
-        try:
-            hour, minute = time_str.strip().split(":")
-            daily_time = datetime.time(int(hour), int(minute))
-            tz = ZoneInfo(DAILY_TZ)
-            app.job_queue.run_daily(generate_ai_draft, time=daily_time, timezone=tz)
-        except Exception:
-            pass
+    for ai_time in AI_POST_AT:
+        app.job_queue.run_daily(generate_ai_draft, time=ai_time, timezone=TZ)
+    app.job_queue.run_repeating(purge_stale_ai_drafts, interval=300, first=300)
     
-    app.run_polling()
+    if PUBLIC_URL:
+        # Telegram yangilanishlarni o'zi yuboradi (getUpdates sikli yo'q)
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=TG_TOKEN,
+            webhook_url=f"{PUBLIC_URL}/{TG_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        # Long polling: bitta getUpdates 25 s gacha kutadi, sikllar orasida pauza yo'q.
+        # Ishga tushishda tarmoq bo'lmasa, bot yiqilmasdan qayta urinadi
+        app.run_polling(timeout=25, poll_interval=0, bootstrap_retries=-1)
 
 
 if __name__ == "__main__":